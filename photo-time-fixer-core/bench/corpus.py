@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# 基准测试用的合成数据：贴近实际分布的文件名语料，以及带日期字段的最小 JPEG/MP4 样本
+import os
+import random
+import struct
+import sys
+from datetime import datetime, timedelta
+
+# (权重, 生成函数)，比例大致参照手机相册导出目录
+START = datetime(2015, 1, 1)
+SPAN = int((datetime(2025, 12, 31) - START).total_seconds())
+IMAGE_EXTS = ['.jpg', '.jpg', '.jpg', '.jpeg', '.png', '.heic']
+VIDEO_EXTS = ['.mp4', '.mp4', '.mov']
+NOISE = ['IMG_E', 'DSC', 'Screenshot', 'photo', 'image', 'download', '新建文件夹', 'copy', 'edit']
+
+
+def random_time(rng: random.Random) -> datetime:
+    return START + timedelta(seconds=rng.randrange(SPAN))
+
+
+def _mmexport(rng, dt):
+    sep = '_' if rng.random() < 0.1 else ''
+    return f'mmexport{sep}{int(dt.timestamp() * 1000) + rng.randrange(1000)}' + rng.choice(IMAGE_EXTS)
+
+
+def _petal(rng, dt):
+    return dt.strftime('petal_%Y%m%d_%H%M%S') + rng.choice(['.jpg', '.mp4'])
+
+
+def _telegram(rng, dt):
+    return dt.strftime('TG-%Y-%m-%d-%H%M%S') + f'{rng.randrange(1000):03d}' + rng.choice(IMAGE_EXTS)
+
+
+def _wechat(rng, dt):
+    # 微信图片_YYYYMMDDHHMMSS_xxx_xx，旧版本没有后缀
+    suffix = f'_{rng.randrange(1000):03d}_{rng.randrange(100):02d}' if rng.random() < 0.8 else ''
+    return dt.strftime('微信图片_%Y%m%d%H%M%S') + suffix + rng.choice(['.jpg', '.png'])
+
+
+def _vid(rng, dt):
+    return dt.strftime('VID_%Y%m%d_%H%M%S') + rng.choice(VIDEO_EXTS)
+
+
+def _img(rng, dt):
+    return dt.strftime('IMG_%Y%m%d_%H%M%S') + rng.choice(IMAGE_EXTS)
+
+
+def _lv(rng, dt):
+    return dt.strftime('lv_0_%Y%m%d%H%M%S') + '.mp4'
+
+
+def _notepad(rng, dt):
+    # Notepad_YYYYMMDDHHMM_xxx 或 vp_output_YYYYMMDDHHMM，只精确到分钟
+    if rng.random() < 0.7:
+        return dt.strftime('Notepad_%Y%m%d%H%M') + f'_{rng.randrange(1000):03d}.jpg'
+    return dt.strftime('vp_output_%Y%m%d%H%M') + '.mp4'
+
+
+def _video(rng, dt):
+    return dt.strftime('video_%y%m%d_%H%M%S') + '.mp4'
+
+
+def _timestamp(rng, dt):
+    if rng.random() < 0.5:
+        return f'{int(dt.timestamp() * 1000)}' + rng.choice(IMAGE_EXTS + VIDEO_EXTS)
+    return f'{int(dt.timestamp())}' + rng.choice(IMAGE_EXTS)
+
+
+def _date_only(rng, dt):
+    return dt.strftime(rng.choice(['%Y-%m-%d', '%Y_%m_%d'])) + f' ({rng.randrange(1, 20)})' + rng.choice(IMAGE_EXTS)
+
+
+def _noise(rng, dt):
+    name = rng.choice(NOISE)
+    if rng.random() < 0.7:
+        name += f'_{rng.randrange(10000):04d}'
+    return name + rng.choice(IMAGE_EXTS + VIDEO_EXTS)
+
+
+FAMILIES = [
+    (25, _mmexport),
+    (5, _petal),
+    (5, _telegram),
+    (10, _wechat),
+    (10, _vid),
+    (15, _img),
+    (5, _lv),
+    (3, _notepad),
+    (3, _video),
+    (7, _timestamp),
+    (5, _date_only),
+    (7, _noise),
+]
+
+
+def generate_names(count: int, seed: int = 20231201) -> list[str]:
+    rng = random.Random(seed)
+    weights = [w for w, _ in FAMILIES]
+    funcs = [f for _, f in FAMILIES]
+    return [func(rng, random_time(rng)) for func in rng.choices(funcs, weights, k=count)]
+
+
+# 样本内嵌的时间统一为 2000-01-01，保证基准中每个文件都需要真正写入
+STALE = datetime(2000, 1, 1)
+QT_EPOCH = datetime(1904, 1, 1)
+
+
+def make_jpeg(dt: datetime = STALE, payload: int = 64 * 1024) -> bytes:
+    # APP1 中 IFD0 含 ModifyDate 和 ExifIFD 指针，ExifIFD 含 DateTimeOriginal/CreateDate
+    date = dt.strftime('%Y:%m:%d %H:%M:%S').encode('ascii') + b'\x00'
+    ifd0 = (struct.pack('<H', 2) + struct.pack('<HHII', 0x0132, 2, 20, 68)
+            + struct.pack('<HHII', 0x8769, 4, 1, 38) + struct.pack('<I', 0))
+    exif = (struct.pack('<H', 2) + struct.pack('<HHII', 0x9003, 2, 20, 88)
+            + struct.pack('<HHII', 0x9004, 2, 20, 108) + struct.pack('<I', 0))
+    app1 = b'Exif\x00\x00' + b'II' + struct.pack('<HI', 42, 8) + ifd0 + exif + date * 3
+    return (b'\xff\xd8' + b'\xff\xe1' + struct.pack('>H', len(app1) + 2) + app1
+            + b'\xff\xda\x00\x02' + os.urandom(payload) + b'\xff\xd9')
+
+
+def _atom(kind: bytes, body: bytes) -> bytes:
+    return struct.pack('>I', 8 + len(body)) + kind + body
+
+
+def make_mp4(dt: datetime = STALE, payload: int = 256 * 1024) -> bytes:
+    # mdat 在前、moov 在后，与手机录制的文件布局一致
+    secs = int((dt - QT_EPOCH).total_seconds())
+    mvhd = _atom(b'mvhd', b'\x00\x00\x00\x00' + struct.pack('>II', secs, secs) + b'\x00' * 88)
+    tkhd = _atom(b'tkhd', b'\x00\x00\x00\x03' + struct.pack('>II', secs, secs) + b'\x00' * 72)
+    mdhd = _atom(b'mdhd', b'\x00\x00\x00\x00' + struct.pack('>II', secs, secs) + b'\x00' * 8)
+    moov = _atom(b'moov', mvhd + _atom(b'trak', tkhd + _atom(b'mdia', mdhd)))
+    ftyp = _atom(b'ftyp', b'isom\x00\x00\x02\x00isomiso2mp41')
+    return ftyp + _atom(b'mdat', os.urandom(payload)) + moov
+
+
+def write_fixtures(directory: str, count: int, video_ratio: float = 0.2, seed: int = 20231201) -> list[tuple[str, datetime]]:
+    # 生成 count 个可解析文件名的样本，返回 [(路径, 文件名对应的时间)]
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    fixtures = []
+    for i in range(count):
+        dt = random_time(rng).replace(microsecond=0)
+        if rng.random() < video_ratio:
+            name, data = dt.strftime('VID_%Y%m%d_%H%M%S') + f'_{i}.mp4', make_mp4()
+        else:
+            name, data = dt.strftime('IMG_%Y%m%d_%H%M%S') + f'_{i}.jpg', make_jpeg()
+        path = os.path.join(directory, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        fixtures.append((path, dt))
+    return fixtures
+
+
+def main():
+    # python3 corpus.py names N       输出 N 个文件名
+    # python3 corpus.py fixtures DIR N 在 DIR 中生成 N 个样本文件
+    if len(sys.argv) >= 3 and sys.argv[1] == 'names':
+        sys.stdout.write('\n'.join(generate_names(int(sys.argv[2]))) + '\n')
+    elif len(sys.argv) >= 4 and sys.argv[1] == 'fixtures':
+        print(f'已生成 {len(write_fixtures(sys.argv[2], int(sys.argv[3])))} 个样本: {sys.argv[2]}')
+    else:
+        print('用法: python3 corpus.py names <数量> | fixtures <目录> <数量>')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# 文件名解析器差分测试与基准：对比 photo_time.parse_time_from_filename 与原始正则级联
+import random
+import re
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from photo_time import parse_time_from_filename  # noqa: E402
+
+
+def legacy_parse_time_from_filename(filename: str) -> datetime | None:
+    # 原始实现，作为差分测试的参照
+    name = Path(filename).stem
+
+    if m := re.match(r'mmexport(\d{13})', name):
+        ts = int(m.group(1)) / 1000
+        return datetime.fromtimestamp(ts)
+
+    if m := re.match(r'mmexport_(\d{13})', name):
+        ts = int(m.group(1)) / 1000
+        return datetime.fromtimestamp(ts)
+
+    if m := re.search(r'_(\d{14})$', name):
+        return datetime.strptime(m.group(1), '%Y%m%d%H%M%S')
+
+    if m := re.match(r'petal_(\d{8})_(\d{6})', name):
+        return datetime.strptime(m.group(1) + m.group(2), '%Y%m%d%H%M%S')
+
+    if m := re.match(r'TG-(\d{4})-(\d{2})-(\d{2})-(\d{6})', name):
+        dt_str = m.group(1) + m.group(2) + m.group(3) + m.group(4)
+        return datetime.strptime(dt_str, '%Y%m%d%H%M%S')
+
+    if m := re.match(r'微信图片_(\d{14})', name):
+        return datetime.strptime(m.group(1), '%Y%m%d%H%M%S')
+
+    if m := re.match(r'VID_(\d{8})_(\d{6})', name):
+        return datetime.strptime(m.group(1) + m.group(2), '%Y%m%d%H%M%S')
+
+    if m := re.search(r'(20\d{2})(0[1-9]|1[0-2])(0[1-9]|[12]\d|3[01])[_-]?(\d{6})', name):
+        dt_str = m.group(1) + m.group(2) + m.group(3) + m.group(4)
+        return datetime.strptime(dt_str, '%Y%m%d%H%M%S')
+
+    if m := re.search(r'(20\d{2})[-_](0[1-9]|1[0-2])[-_](0[1-9]|[12]\d|3[01])', name):
+        return datetime(int(m.group(1)), int(m.group(2)), int(m.group(3)), 12, 0, 0)
+
+    if m := re.search(r'_(20\d{2})(0[1-9]|1[0-2])(0[1-9]|[12]\d|3[01])([01]\d|2[0-3])([0-5]\d)', name):
+        return datetime(int(m.group(1)), int(m.group(2)), int(m.group(3)), int(m.group(4)), int(m.group(5)), 0)
+
+    matches = list(re.finditer(r'(\d{13})', name))
+    if matches:
+        for m in reversed(matches):
+            ts = int(m.group(1)) / 1000
+            if 1000000000 < ts < 2000000000:
+                return datetime.fromtimestamp(ts)
+
+    if m := re.search(r'(\d{10})', name):
+        ts = int(m.group(1))
+        if 1000000000 < ts < 2000000000:
+            return datetime.fromtimestamp(ts)
+
+    if m := re.match(r'video_(\d{2})(\d{2})(\d{2})_(\d{2})(\d{2})(\d{2})', name):
+        year = 2000 + int(m.group(1))
+        return datetime(year, int(m.group(2)), int(m.group(3)), int(m.group(4)), int(m.group(5)), int(m.group(6)))
+
+    return None
+
+
+PREFIXES = ['mmexport', 'mmexport_', 'petal_', 'TG-', '微信图片_', 'VID_', 'video_', 'lv_0_', 'Notepad_',
+            'vp_output_', 'IMG_', 'Screenshot_', '', 'DSC', 'wx_camera_']
+EXTS = ['.jpg', '.JPG', '.jpeg', '.png', '.heic', '.mp4', '.mov', '', '.', '.tar.gz']
+SEPARATORS = ['', '_', '-', ' ', '.']
+ODD_DIGITS = '٠١٢٣٤٥٦٧٨٩０１２３４５６７８９'
+
+
+def random_digits(rng: random.Random, n: int) -> str:
+    return ''.join(rng.choice('0123456789') for _ in range(n))
+
+
+def random_time(rng: random.Random) -> datetime:
+    return datetime.fromtimestamp(rng.randint(1000000000, 1999999999))
+
+
+def random_chunk(rng: random.Random) -> str:
+    dt = random_time(rng)
+    kind = rng.randrange(14)
+    if kind == 0:
+        return str(int(dt.timestamp() * 1000) + rng.randrange(1000))
+    if kind == 1:
+        return str(int(dt.timestamp()))
+    if kind == 2:
+        return dt.strftime('%Y%m%d%H%M%S')
+    if kind == 3:
+        return dt.strftime('%Y%m%d_%H%M%S')
+    if kind == 4:
+        return dt.strftime('%Y-%m-%d-%H%M%S')
+    if kind == 5:
+        return dt.strftime(rng.choice(['%Y-%m-%d', '%Y_%m_%d', '%Y-%m_%d']))
+    if kind == 6:
+        return dt.strftime('%Y%m%d%H%M')
+    if kind == 7:
+        return dt.strftime('%y%m%d_%H%M%S')
+    if kind == 8:
+        # 日期字段越界，覆盖 strptime/datetime 抛出 ValueError 的分支
+        return f'20{rng.randrange(100):02d}{rng.randrange(20):02d}{rng.randrange(40):02d}{rng.randrange(30):02d}{rng.randrange(70):02d}{rng.randrange(70):02d}'
+    if kind == 9:
+        return random_digits(rng, rng.randrange(1, 20))
+    if kind == 10:
+        digits = random_digits(rng, 14)
+        return ''.join(rng.choice(ODD_DIGITS) if rng.random() < 0.2 else c for c in digits)
+    if kind == 11:
+        return ''.join(rng.choice('abcXYZ微信图片') for _ in range(rng.randrange(1, 8)))
+    if kind == 12:
+        return str(rng.randrange(10 ** 12, 10 ** 14))
+    return rng.choice(['2023', '20231', '202312', 'IMG', 'copy', '(1)'])
+
+
+def random_name(rng: random.Random) -> str:
+    parts = [rng.choice(PREFIXES)]
+    for _ in range(rng.randrange(1, 4)):
+        if len(parts) > 1 or rng.random() < 0.3:
+            parts.append(rng.choice(SEPARATORS))
+        parts.append(random_chunk(rng))
+    name = ''.join(parts) + rng.choice(EXTS)
+    if rng.random() < 0.01:
+        name = rng.choice(['dir/', 'a/b/', './']) + name
+    return name
+
+
+def outcome(func, name: str):
+    try:
+        return func(name)
+    except ValueError:
+        return ValueError
+
+
+def check(names: list[str]) -> int:
+    mismatches = 0
+    for name in names:
+        expected = outcome(legacy_parse_time_from_filename, name)
+        actual = outcome(parse_time_from_filename, name)
+        if expected != actual:
+            mismatches += 1
+            if mismatches <= 20:
+                print(f'不一致: {name!r}: 原始={expected!r} 新={actual!r}')
+    return mismatches
+
+
+def throughput(func, names: list[str]) -> float:
+    start = time.perf_counter()
+    for name in names:
+        try:
+            func(name)
+        except ValueError:
+            pass
+    return len(names) / (time.perf_counter() - start)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    rng = random.Random(20231201)
+    names = [random_name(rng) for _ in range(count)]
+
+    mismatches = check(names)
+    print(f'差分测试: {count} 个文件名, 不一致 {mismatches} 个')
+
+    sample = names[:min(count, 200000)]
+    legacy = throughput(legacy_parse_time_from_filename, sample)
+    current = throughput(parse_time_from_filename, sample)
+    print(f'原始级联: {legacy:,.0f} 个/秒')
+    print(f'编译引擎: {current:,.0f} 个/秒 ({current / legacy:.1f}x)')
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# 基准测试：文件名解析吞吐、各写入后端的写入吞吐、/process 在不同批大小下的延迟与内存，结果输出为 JSON
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / 'src'))
+sys.path.insert(0, str(BENCH_DIR))
+
+from corpus import generate_names, write_fixtures  # noqa: E402
+from photo_time import BACKENDS, FAILED, fix_exif_times, parse_many, parse_time_from_filename  # noqa: E402
+
+SECTIONS = ('parse', 'write', 'process')
+
+
+def get_option(name: str, default: str) -> str:
+    args = sys.argv[1:]
+    if name in args and args.index(name) + 1 < len(args):
+        return args[args.index(name) + 1]
+    return default
+
+
+def log(message: str):
+    # 进度和摘要写到 stderr，stdout 只输出 JSON
+    print(message, file=sys.stderr)
+
+
+def bench_parse(count: int) -> dict:
+    names = generate_names(count)
+
+    start = time.perf_counter()
+    for name in names:
+        try:
+            parse_time_from_filename(name)
+        except ValueError:
+            pass
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parsed = parse_many(names)
+    batch = time.perf_counter() - start
+
+    result = {
+        'names': count,
+        'parsed': sum(dt is not None for dt in parsed),
+        'names_per_sec': count / single,
+        'parse_many_names_per_sec': count / batch,
+    }
+    log(f'解析: {result["names_per_sec"]:,.0f} 个/秒, parse_many {result["parse_many_names_per_sec"]:,.0f} 个/秒, '
+        f'可解析 {result["parsed"]}/{count}')
+    return result
+
+
+def bench_write_pass(fixtures: list[tuple[str, datetime]], backend: str, skip_correct: bool) -> dict:
+    failed = 0
+    start = time.perf_counter()
+    for path, dt in fixtures:
+        if fix_exif_times([path], dt, skip_correct=skip_correct, backend=backend)[path] == FAILED:
+            failed += 1
+    elapsed = time.perf_counter() - start
+    return {'files': len(fixtures), 'failed': failed, 'seconds': elapsed, 'files_per_sec': len(fixtures) / elapsed}
+
+
+def bench_write(count: int) -> dict:
+    # 每个后端使用全新的样本；再跑一遍 auto 以测量“已正确”跳过路径
+    from exiftool_pool import EXIFTOOL, shutdown_pool
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in BACKENDS:
+            # 与进程池一致，按 EXIFTOOL 环境变量查找
+            if backend == 'exiftool' and shutil.which(EXIFTOOL) is None:
+                results[backend] = {'skipped': '未找到 exiftool'}
+                log(f'写入 {backend}: 跳过（未找到 exiftool）')
+                continue
+            fixtures = write_fixtures(os.path.join(tmp, backend), count)
+            results[backend] = bench_write_pass(fixtures, backend, skip_correct=False)
+            log(f'写入 {backend}: {results[backend]["files_per_sec"]:,.1f} 个/秒, 失败 {results[backend]["failed"]}')
+            if backend == 'auto':
+                results['auto_recheck'] = bench_write_pass(fixtures, backend, skip_correct=True)
+                log(f'写入 auto（已正确）: {results["auto_recheck"]["files_per_sec"]:,.1f} 个/秒')
+    shutdown_pool()
+    return results
+
+
+def multipart_body(paths: list[str], boundary: str) -> bytes:
+    parts = []
+    for path in paths:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="files"; '
+                     f'filename="{os.path.basename(path)}"\r\nContent-Type: application/octet-stream\r\n\r\n'.encode())
+        parts.append(Path(path).read_bytes())
+        parts.append(b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts)
+
+
+def bench_process(batch_sizes: list[int], repeat: int) -> list[dict] | dict:
+    try:
+        import server
+    except ImportError as e:
+        log(f'/process: 跳过（{e}）')
+        return {'skipped': str(e)}
+
+    client = server.app.test_client()
+    boundary = 'photo-time-fixer-bench'
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        fixtures = write_fixtures(tmp, max(batch_sizes))
+        for size in batch_sizes:
+            body = multipart_body([path for path, _ in fixtures[:size]], boundary)
+
+            def post() -> int:
+                response = client.post('/process', data=body,
+                                       content_type=f'multipart/form-data; boundary={boundary}')
+                return len(response.get_data())
+
+            latencies = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                zip_size = post()
+                latencies.append(time.perf_counter() - start)
+
+            # 单独跑一次统计内存峰值，避免 tracemalloc 的开销计入延迟
+            tracemalloc.start()
+            post()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            results.append({
+                'batch_size': size,
+                'request_bytes': len(body),
+                'response_bytes': zip_size,
+                'latency_sec': statistics.median(latencies),
+                'latency_min_sec': min(latencies),
+                'files_per_sec': size / statistics.median(latencies),
+                'peak_python_bytes': peak,
+            })
+            log(f'/process 批大小 {size}: {results[-1]["latency_sec"] * 1000:,.1f} ms, '
+                f'Python 内存峰值 {peak / 1024 / 1024:,.1f} MB')
+    return results
+
+
+def main():
+    # 用法: python3 run_bench.py [--names N] [--files N] [--batch-sizes 1,10,50] [--repeat N]
+    #                           [--only parse,write,process] [--output 结果.json]
+    names = int(get_option('--names', '200000'))
+    files = int(get_option('--files', '200'))
+    batch_sizes = [int(n) for n in get_option('--batch-sizes', '1,10,50').split(',')]
+    repeat = int(get_option('--repeat', '3'))
+    only = get_option('--only', ','.join(SECTIONS)).split(',')
+    output = get_option('--output', '')
+
+    report = {
+        'meta': {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+    }
+    if 'parse' in only:
+        report['parse'] = bench_parse(names)
+    if 'write' in only:
+        report['write'] = bench_write(files)
+    if 'process' in only:
+        report['process'] = bench_process(batch_sizes, repeat)
+
+    data = json.dumps(report, ensure_ascii=False, indent=2)
+    if output:
+        Path(output).write_text(data + '\n', encoding='utf-8')
+        log(f'结果已写入 {output}')
+    else:
+        print(data)
+
+
+if __name__ == '__main__':
+    main()
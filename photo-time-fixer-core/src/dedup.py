@@ -0,0 +1,69 @@
+import hashlib
+import os
+from pathlib import Path
+
+# 内容去重：先按大小分组，再比较首尾块的部分哈希，最后用流式全量哈希确认，
+# 只有前一步仍相同的文件才进入下一步，大部分文件只需一次 stat
+
+PARTIAL_BLOCK = 64 * 1024
+HASH_CHUNK = 1024 * 1024
+
+
+def partial_hash(path, size: int) -> str:
+    # 文件不超过两块时读取全部内容，此时部分哈希即全量比较
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        h.update(f.read(PARTIAL_BLOCK))
+        if size > PARTIAL_BLOCK:
+            f.seek(max(PARTIAL_BLOCK, size - PARTIAL_BLOCK))
+            h.update(f.read(PARTIAL_BLOCK))
+    return h.hexdigest()
+
+
+def full_hash(path) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        while chunk := f.read(HASH_CHUNK):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _group_by(paths: list[Path], key) -> list[list[Path]]:
+    groups = {}
+    for path in paths:
+        try:
+            groups.setdefault(key(path), []).append(path)
+        except OSError:
+            continue
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def duplicate_groups(files: list[tuple[Path, int]]) -> list[list[Path]]:
+    # files 为 [(路径, 大小)]，返回内容相同的文件组，组内保持输入顺序，第一个作为保留的文件
+    sizes = {path: size for path, size in files}
+    candidates = _group_by([path for path, _ in files], sizes.__getitem__)
+    groups = []
+    for group in candidates:
+        size = sizes[group[0]]
+        for same in _group_by(group, lambda p: partial_hash(p, size)):
+            if size <= 2 * PARTIAL_BLOCK:
+                groups.append(same)
+            else:
+                groups.extend(_group_by(same, full_hash))
+    order = {path: i for i, (path, _) in enumerate(files)}
+    return sorted(groups, key=lambda group: order[group[0]])
+
+
+def replace_with_link(path: Path, target: Path) -> bool:
+    # 先在同目录建临时硬链接再原子替换，任何一步失败原文件都保持不变；
+    # 已经是指向 target 的硬链接（上次运行已替换）时返回 False，此时 os.replace 什么也不做
+    if os.path.samefile(path, target):
+        return False
+    tmp = path.with_name(f'.{path.name}.dedup')
+    tmp.unlink(missing_ok=True)
+    os.link(target, tmp)
+    try:
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return True
@@ -0,0 +1,199 @@
+import atexit
+import os
+import queue
+import subprocess
+import threading
+from typing import NamedTuple
+
+from metrics import METRICS
+
+EXIFTOOL = os.environ.get('EXIFTOOL', 'exiftool')
+
+
+class ExifToolError(RuntimeError):
+    pass
+
+
+class ExifResult(NamedTuple):
+    status: int
+    stdout: str
+    stderr: str
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 0
+
+
+def default_pool_size() -> int:
+    if size := os.environ.get('EXIFTOOL_WORKERS'):
+        return max(1, int(size))
+    return min(4, os.cpu_count() or 1)
+
+
+class ExifToolWorker:
+    # 常驻 exiftool 进程：-stay_open True -@ - 从 stdin 逐行读取参数，
+    # 每条命令以 -executeN 结束，stdout 输出 {readyN} 作为结束标记
+    def __init__(self, executable: str = EXIFTOOL):
+        self.executable = executable
+        self._proc = None
+        self._stderr = None
+        self._seq = 0
+
+    @property
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def start(self):
+        METRICS.inc('exiftool_spawns_total')
+        with METRICS.stage('exiftool_spawn'):
+            self._start()
+
+    def _start(self):
+        self._proc = subprocess.Popen(
+            [self.executable, '-stay_open', 'True', '-@', '-',
+             '-common_args', '-charset', 'filename=utf8'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        # stderr 单独线程读取，避免错误输出过多时管道写满导致死锁
+        self._stderr = queue.Queue()
+        threading.Thread(target=self._drain_stderr, args=(self._proc.stderr, self._stderr), daemon=True).start()
+
+    @staticmethod
+    def _drain_stderr(stream, lines: queue.Queue):
+        for line in iter(stream.readline, b''):
+            lines.put(line)
+        lines.put(None)
+
+    def execute(self, args: list[str]) -> ExifResult:
+        if not self.alive:
+            self.start()
+        self._seq += 1
+        ready = f'{{ready{self._seq}}}'
+        # -echo3 在命令执行完成后把退出状态写到 stdout，-echo4 把结束标记写到 stderr
+        cmd = [*args, '-echo3', '${status}', '-echo4', ready, f'-execute{self._seq}']
+        try:
+            self._proc.stdin.write(('\n'.join(cmd) + '\n').encode('utf-8'))
+            self._proc.stdin.flush()
+        except OSError as e:
+            raise ExifToolError(f'exiftool 进程已退出: {e}') from e
+
+        out = []
+        while True:
+            line = self._proc.stdout.readline()
+            if not line:
+                raise ExifToolError('exiftool 进程意外退出')
+            text = line.decode('utf-8', 'replace').rstrip('\r\n')
+            if text == ready:
+                break
+            out.append(text)
+
+        err = []
+        while (line := self._stderr.get()) is not None:
+            text = line.decode('utf-8', 'replace').rstrip('\r\n')
+            if text == ready:
+                break
+            err.append(text)
+        else:
+            raise ExifToolError('exiftool 进程意外退出')
+
+        status = 1
+        if out and out[-1].strip().isdigit():
+            status = int(out.pop().strip())
+        return ExifResult(status, '\n'.join(out), '\n'.join(err))
+
+    def close(self, timeout: float = 5):
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            if proc.poll() is None:
+                proc.stdin.write(b'-stay_open\nFalse\n')
+                proc.stdin.flush()
+            proc.wait(timeout=timeout)
+        except (OSError, subprocess.TimeoutExpired):
+            proc.kill()
+            proc.wait()
+        finally:
+            for stream in (proc.stdin, proc.stdout, proc.stderr):
+                try:
+                    stream.close()
+                except OSError:
+                    pass
+
+
+class ExifToolPool:
+    # 常驻 exiftool 进程池，按需启动，最多 size 个；进程崩溃后自动重启
+    def __init__(self, size: int | None = None, executable: str = EXIFTOOL):
+        self.size = max(1, size or default_pool_size())
+        self.executable = executable
+        self._idle = queue.LifoQueue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _acquire(self) -> ExifToolWorker:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._closed:
+                raise ExifToolError('exiftool 进程池已关闭')
+            if len(self._workers) < self.size:
+                worker = ExifToolWorker(self.executable)
+                self._workers.append(worker)
+                return worker
+        return self._idle.get()
+
+    def execute(self, args: list[str]) -> ExifResult:
+        worker = self._acquire()
+        METRICS.inc('exiftool_calls_total')
+        try:
+            try:
+                # 启动耗时单独计入 exiftool_spawn
+                if not worker.alive:
+                    worker.start()
+                with METRICS.stage('exiftool_write'):
+                    return worker.execute(args)
+            except ExifToolError:
+                # 进程崩溃：重启后重试一次
+                worker.close()
+                try:
+                    return worker.execute(args)
+                except ExifToolError as e:
+                    worker.close()
+                    return ExifResult(1, '', str(e))
+        finally:
+            self._idle.put(worker)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(size: int | None = None) -> ExifToolPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ExifToolPool(size)
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+
+
+atexit.register(shutdown_pool)
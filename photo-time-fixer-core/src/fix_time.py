@@ -1,174 +1,695 @@
 #!/usr/bin/env python3
+import json
 import os
-import re
-import subprocess
+import signal
 import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
+from functools import partial
+from itertools import chain
 from pathlib import Path
+from typing import NamedTuple
 
+from dedup import duplicate_groups, replace_with_link
+from exiftool_pool import get_pool, shutdown_pool
+from metadata import date_mismatches
+from metrics import METRICS
+from photo_time import (BACKENDS, CORRECT, FAILED, REGISTRY, SPECIAL_PREFIXES, fix_exif_times, is_video,
+                        load_patterns, match_many)
+from rename import RenamePlanner, rename_file
+from scan import FileFilter, scan_files
+from state import STATE_FILE_NAME, StateIndex
+from tz import ZONE
+from watch import Debouncer, PollingWatcher, open_watcher
 
-def parse_time_from_filename(filename: str) -> datetime | None:
-    name = Path(filename).stem
-    
-    # mmexport + 13位毫秒时间戳
-    if m := re.match(r'mmexport(\d{13})', name):
-        ts = int(m.group(1)) / 1000
-        return datetime.fromtimestamp(ts)
-    
-    # mmexport_ + 13位毫秒时间戳
-    if m := re.match(r'mmexport_(\d{13})', name):
-        ts = int(m.group(1)) / 1000
-        return datetime.fromtimestamp(ts)
-    
-    # lv_xxx_YYYYMMDDHHMMSS
-    if m := re.search(r'_(\d{14})$', name):
-        return datetime.strptime(m.group(1), '%Y%m%d%H%M%S')
-    
-    # petal_YYYYMMDD_HHMMSS
-    if m := re.match(r'petal_(\d{8})_(\d{6})', name):
-        return datetime.strptime(m.group(1) + m.group(2), '%Y%m%d%H%M%S')
-    
-    # TG-YYYY-MM-DD-HHMMSS
-    if m := re.match(r'TG-(\d{4})-(\d{2})-(\d{2})-(\d{6})', name):
-        dt_str = m.group(1) + m.group(2) + m.group(3) + m.group(4)
-        return datetime.strptime(dt_str, '%Y%m%d%H%M%S')
-    
-    # 微信图片_YYYYMMDDHHMMSS_xxx_xx
-    if m := re.match(r'微信图片_(\d{14})', name):
-        return datetime.strptime(m.group(1), '%Y%m%d%H%M%S')
-    
-    # VID_YYYYMMDD_HHMMSS
-    if m := re.match(r'VID_(\d{8})_(\d{6})', name):
-        return datetime.strptime(m.group(1) + m.group(2), '%Y%m%d%H%M%S')
-    
-    # 通用：YYYYMMDD_HHMMSS 或 YYYYMMDDHHMMSS
-    if m := re.search(r'(20\d{2})(0[1-9]|1[0-2])(0[1-9]|[12]\d|3[01])[_-]?(\d{6})', name):
-        dt_str = m.group(1) + m.group(2) + m.group(3) + m.group(4)
-        return datetime.strptime(dt_str, '%Y%m%d%H%M%S')
-    
-    # 通用：YYYY-MM-DD 或 YYYY_MM_DD
-    if m := re.search(r'(20\d{2})[-_](0[1-9]|1[0-2])[-_](0[1-9]|[12]\d|3[01])', name):
-        return datetime(int(m.group(1)), int(m.group(2)), int(m.group(3)), 12, 0, 0)
-    
-    # Notepad_YYYYMMDDHHMM_xxx 或 vp_output_YYYYMMDDHHMM
-    if m := re.search(r'_(20\d{2})(0[1-9]|1[0-2])(0[1-9]|[12]\d|3[01])([01]\d|2[0-3])([0-5]\d)', name):
-        return datetime(int(m.group(1)), int(m.group(2)), int(m.group(3)), int(m.group(4)), int(m.group(5)), 0)
-    
-    # 通用：13位毫秒时间戳（优先匹配最后一个）
-    matches = list(re.finditer(r'(\d{13})', name))
-    if matches:
-        for m in reversed(matches):
-            ts = int(m.group(1)) / 1000
-            if 1000000000 < ts < 2000000000:
-                return datetime.fromtimestamp(ts)
-    
-    # 通用：10位秒时间戳
-    if m := re.search(r'(\d{10})', name):
-        ts = int(m.group(1))
-        if 1000000000 < ts < 2000000000:
-            return datetime.fromtimestamp(ts)
-    
-    # video_YYMMDD_HHMMSS
-    if m := re.match(r'video_(\d{2})(\d{2})(\d{2})_(\d{2})(\d{2})(\d{2})', name):
-        year = 2000 + int(m.group(1))
-        return datetime(year, int(m.group(2)), int(m.group(3)), int(m.group(4)), int(m.group(5)), int(m.group(6)))
-    
-    return None
-
-
-def fix_exif_time(filepath: str, dt: datetime) -> bool:
-    dt_str = dt.strftime('%Y:%m:%d %H:%M:%S')
-    cmd = [
-        'exiftool',
-        '-overwrite_original',
-        f'-AllDates={dt_str}',
-        f'-FileModifyDate={dt_str}',
-        f'-FileCreateDate={dt_str}',
-    ]
-    
-    # 针对视频文件增加更多时间标签
-    ext = Path(filepath).suffix.lower()
-    if ext in ['.mp4', '.mov', '.m4v', '.3gp', '.avi', '.mkv', '.wmv']:
-        cmd.extend([
-            f'-CreateDate={dt_str}',
-            f'-ModifyDate={dt_str}',
-            f'-TrackCreateDate={dt_str}',
-            f'-TrackModifyDate={dt_str}',
-            f'-MediaCreateDate={dt_str}',
-            f'-MediaModifyDate={dt_str}',
-            f'-CreationDate={dt_str}',
-            f'-DateTimeOriginal={dt_str}',
-        ])
-    
-    cmd.append(filepath)
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode == 0:
-        ts = dt.timestamp()
-        os.utime(filepath, (ts, ts))
-        return True
-    return False
+
+class Task(NamedTuple):
+    seq: int
+    path: Path
+    dt: datetime | None
+    new_path: Path | None = None
+    pattern: str | None = None
+    duplicate_of: Path | None = None
+    
+    @property
+    def key(self) -> tuple[datetime, bool] | None:
+        if self.dt is None or self.duplicate_of:
+            return None
+        return self.dt, is_video(self.path.name)
+
+
+class Result(NamedTuple):
+    seq: int
+    lines: list[str]
+    renamed: bool
+    status: str
+    path: Path
+    dt: datetime | None
+    task: Task | None = None
+    seconds: float = 0.0
+
+
+FORMATS = ('text', 'jsonl')
+DEDUP_MODES = ('skip', 'link', 'report')
+WATCH_MODES = ('auto', 'poll')
+
+
+def plan_batches(tasks, batch_size: int, max_open: int | None = None):
+    # 按 (时间, 图片/视频标签集) 分组，每组满 batch_size 个即输出；
+    # 大多数文件的时间各不相同，未满的组超过 max_open 个时先输出最早的一组，不必等遍历结束
+    groups = {}
+    for task in tasks:
+        key = task.key
+        if key is None:
+            yield [task]
+            continue
+        group = groups.setdefault(key, [])
+        group.append(task)
+        if len(group) >= batch_size:
+            yield groups.pop(key)
+        elif max_open is not None and len(groups) > max_open:
+            yield groups.pop(next(iter(groups)))
+    yield from groups.values()
+
+
+def by_directory(tasks):
+    # 重命名时判断重复要读取已分配目标的原文件内容，同一目录的文件全部规划完才交给处理，
+    # 避免读到正在写入的文件；目录内的文件已由 scan_files 一次列出，等待的只是解析和规划
+    held = []
+    for task in tasks:
+        if held and task.path.parent != held[0].path.parent:
+            yield from held
+            held = []
+        held.append(task)
+    yield from held
+
+
+def get_options(name: str) -> list[str]:
+    values = []
+    for i, arg in enumerate(sys.argv):
+        if arg == name and i + 1 < len(sys.argv):
+            values.append(sys.argv[i + 1])
+        elif arg.startswith(name + '='):
+            values.append(arg[len(name) + 1:])
+    return values
+
+
+def get_option(name: str, default: str | None = None) -> str | None:
+    values = get_options(name)
+    return values[-1] if values else default
+
+
+def ordered_map(executor: ThreadPoolExecutor | None, fn, items, window: int):
+    # 按输入顺序产出结果，最多 window 个任务在途，边遍历目录边处理
+    if executor is None:
+        yield from map(fn, items)
+        return
+    futures = deque()
+    for item in items:
+        futures.append(executor.submit(fn, item))
+        if len(futures) >= window:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()
+
+
+def process_batch(batch: list[Task], force: bool = False, backend: str = 'auto') -> list[Result]:
+    # 返回每个文件的处理结果，path 为处理后的文件路径
+    results = {}
+    targets = {}
+    for task in batch:
+        if task.dt is None:
+            results[task.seq] = Result(task.seq, [f"- {task.path.name} (无法解析)"], False, 'skipped', task.path, None)
+        elif task.duplicate_of is not None:
+            results[task.seq] = duplicate_result(task)
+        elif task.new_path is not None:
+            with METRICS.stage('rename'):
+                new_path = rename_file(task.path, task.new_path, task.dt)
+            results[task.seq] = Result(task.seq, [f"✓ {task.path.name} -> {new_path.name}"], True, '', new_path, task.dt)
+            targets[task.seq] = new_path
+        else:
+            results[task.seq] = Result(task.seq, [], False, '', task.path, task.dt)
+            targets[task.seq] = task.path
+    
+    if targets:
+        dt = batch[0].dt
+        statuses = fix_exif_times([str(f) for f in targets.values()], dt, skip_correct=not force, backend=backend)
+        for seq, f in targets.items():
+            result = results[seq]
+            status = statuses[str(f)]
+            if status == FAILED:
+                result.lines.append(f"✗ {f.name} (写入失败)")
+            elif status == CORRECT and not result.renamed:
+                result.lines.append(f"✓ {f.name} -> {dt} (已正确，未重写)")
+            elif not result.renamed:
+                result.lines.append(f"✓ {f.name} -> {dt}")
+            results[seq] = result._replace(status=status)
+    
+    if METRICS.enabled:
+        METRICS.inc('bytes_processed_total', sum(f.stat().st_size for f in targets.values() if f.exists()))
+    return list(results.values())
+
+
+def duplicate_result(task: Task) -> Result:
+    line = f"= {task.path.name} (与 {task.duplicate_of.name} 内容相同，跳过)"
+    return Result(task.seq, [line], False, 'duplicate', task.path, task.dt)
+
+
+def verify_batch(batch: list[Task]) -> list[Result]:
+    # 只读取内嵌时间并与文件名解析结果比较，不修改任何文件
+    results = []
+    for task in batch:
+        name = task.path.name
+        if task.dt is None:
+            results.append(Result(task.seq, [f"- {name} (无法解析)"], False, 'skipped', task.path, None))
+            continue
+        try:
+            mismatches = date_mismatches(task.path, ZONE.aware(task.dt))
+        except OSError as e:
+            results.append(Result(task.seq, [f"? {name} ({e})"], False, 'unreadable', task.path, task.dt))
+            continue
+        if mismatches is None:
+            results.append(Result(task.seq, [f"? {name} (无法读取内嵌时间)"], False, 'unreadable', task.path, task.dt))
+        elif not mismatches:
+            results.append(Result(task.seq, [f"✓ {name} (一致)"], False, 'match', task.path, task.dt))
+        else:
+            found = ', '.join(f"{tag}={value or '缺失'}" for tag, value in mismatches)
+            line = f"✗ {name}: {found} (期望 {task.dt.replace(microsecond=0)})"
+            results.append(Result(task.seq, [line], False, 'mismatch', task.path, task.dt))
+    return results
+
+
+def plan_batch(batch: list[Task]) -> list[Result]:
+    # --dry-run：只输出重命名和写入计划，不修改任何文件；只有目标重名时才读取内容判断是否重复
+    results = []
+    for task in batch:
+        name = task.path.name
+        if task.dt is None:
+            results.append(Result(task.seq, [f"- {name} (无法解析)"], False, 'skipped', task.path, None))
+        elif task.duplicate_of is not None:
+            results.append(duplicate_result(task))
+        elif task.new_path is not None:
+            line = f"· {name} -> {task.new_path.name} ({task.dt})"
+            results.append(Result(task.seq, [line], True, 'planned', task.new_path, task.dt))
+        else:
+            results.append(Result(task.seq, [f"· {name} -> {task.dt}"], False, 'planned', task.path, task.dt))
+    return results
+
+
+def run_batch(handler, batch: list[Task]) -> list[Result]:
+    # 同一批共用一次 exiftool 调用，单文件耗时按批内文件数均摊
+    start = time.perf_counter()
+    results = handler(batch)
+    elapsed = (time.perf_counter() - start) / len(batch)
+    tasks = {task.seq: task for task in batch}
+    for _ in batch:
+        METRICS.observe('file_seconds', elapsed)
+    return [result._replace(task=tasks[result.seq], seconds=elapsed) for result in results]
+
+
+def result_record(result: Result, root: Path) -> dict:
+    # --format jsonl 的单条记录，路径相对于目标目录
+    task = result.task
+    error = '写入失败' if result.status == FAILED else None
+    old = task.path.relative_to(root).as_posix()
+    # 重命名只改文件名，不换目录
+    new = old[:len(old) - len(task.path.name)] + result.path.name if result.path != task.path else None
+    return {
+        'old': old,
+        'new': new,
+        'time': result.dt.isoformat() if result.dt else None,
+        'pattern': task.pattern,
+        'status': result.status,
+        'error': error,
+        'duplicate_of': task.duplicate_of.relative_to(root).as_posix() if task.duplicate_of else None,
+        'duration_ms': round(result.seconds * 1000, 3),
+    }
+
+
+def print_result(result: Result, root: Path, jsonl: bool):
+    if jsonl:
+        sys.stdout.write(json.dumps(result_record(result, root), ensure_ascii=False) + '\n')
+    else:
+        for line in result.lines:
+            print(line)
+
+
+PARSE_CHUNK = 256
+
+
+class Options(NamedTuple):
+    target_dir: Path
+    rename: bool = False
+    recursive: bool = False
+    file_filter: FileFilter | None = None
+    jobs: int = 1
+    batch_size: int = 50
+    state_file: Path | None = None
+    verify: bool = False
+    force: bool = False
+    backend: str = 'auto'
+    stats: bool = False
+    format: str = 'text'
+    dry_run: bool = False
+    dedup: str | None = None
+    watch: str | None = None
+    settle: float = 2.0
+    pattern_stats: bool = False
 
 
 def main():
     if len(sys.argv) < 2:
-        print("用法: python3 fix_time.py <目录路径> [--rename] [--only-special]")
+        print("用法: python3 fix_time.py <目录路径> [--rename] [--recursive] [--only-special] [--include 通配符] "
+              "[--exclude 通配符] [--ext jpg,mp4] [--jobs N] [--batch-size N] [--workers N] [--state[=文件]] "
+              "[--verify] [--force] [--backend auto|exiftool] [--stats] "
+              "[--format text|jsonl] [--dry-run] [--dedup skip|link|report] [--watch[=poll]] [--settle 秒] "
+              "[--tz 时区] [--patterns 规则文件] [--pattern-stats]")
         sys.exit(1)
     
-    rename_mode = '--rename' in sys.argv
-    only_special = '--only-special' in sys.argv
-    
     target_dir = Path(sys.argv[1])
     if not target_dir.is_dir():
         print(f"错误: {target_dir} 不是有效目录")
         sys.exit(1)
     
-    fixed = 0
-    skipped = 0
-    failed = 0
-    renamed = 0
+    state_file = None
+    if '--state' in sys.argv:
+        state_file = target_dir / STATE_FILE_NAME
+    elif value := get_option('--state'):
+        state_file = Path(value)
     
-    for f in sorted(target_dir.iterdir()):
-        if not f.is_file():
-            continue
-        
-        # 批量模式过滤
-        if only_special:
-            name_lower = f.name.lower()
-            if not (name_lower.startswith('mmexport') or name_lower.startswith('petal')):
-                continue
-        
-        dt = parse_time_from_filename(f.name)
-        if dt:
-            if rename_mode:
-                ts = int(dt.timestamp())
-                ext = f.suffix
-                new_name = dt.strftime('%Y%m%d%H%M%S') + '_' + str(ts) + ext
-                new_path = f.parent / new_name
-                if not new_path.exists():
-                    f.rename(new_path)
-                    print(f"✓ {f.name} -> {new_name}")
-                    renamed += 1
-                    f = new_path
+    # --only-special 等价于 --include mmexport* --include petal*
+    include = get_options('--include')
+    if '--only-special' in sys.argv:
+        include += [prefix + '*' for prefix in SPECIAL_PREFIXES]
+    exts = [e for value in get_options('--ext') for e in value.split(',') if e]
+    exclude = get_options('--exclude')
+    
+    # --watch 自动选择 inotify 或轮询，--watch=poll 强制轮询
+    watch_mode = 'auto' if '--watch' in sys.argv else get_option('--watch')
+    
+    opts = Options(
+        target_dir=target_dir,
+        rename='--rename' in sys.argv,
+        recursive='--recursive' in sys.argv,
+        file_filter=FileFilter(include, exclude, exts) if include or exclude or exts else None,
+        jobs=max(1, int(get_option('--jobs', '1'))),
+        batch_size=max(1, int(get_option('--batch-size', '50'))),
+        state_file=state_file,
+        verify='--verify' in sys.argv,
+        force='--force' in sys.argv,
+        backend=get_option('--backend', 'auto'),
+        stats='--stats' in sys.argv,
+        format=get_option('--format', 'text'),
+        dry_run='--dry-run' in sys.argv,
+        dedup=get_option('--dedup'),
+        watch=watch_mode,
+        settle=max(0.0, float(get_option('--settle', '2'))),
+        pattern_stats='--pattern-stats' in sys.argv,
+    )
+    if opts.backend not in BACKENDS:
+        print(f"错误: --backend 只能是 {'/'.join(BACKENDS)}")
+        sys.exit(1)
+    if opts.format not in FORMATS:
+        print(f"错误: --format 只能是 {'/'.join(FORMATS)}")
+        sys.exit(1)
+    if opts.dedup is not None and opts.dedup not in DEDUP_MODES:
+        print(f"错误: --dedup 只能是 {'/'.join(DEDUP_MODES)}")
+        sys.exit(1)
+    if opts.watch is not None:
+        if opts.watch not in WATCH_MODES:
+            print(f"错误: --watch 只能是 {'/'.join(WATCH_MODES)}")
+            sys.exit(1)
+        if opts.verify or opts.dry_run or opts.dedup:
+            print("错误: --watch 不能与 --verify、--dry-run、--dedup 同时使用")
+            sys.exit(1)
+    
+    # 时间戳文件名按 --tz 换算为本地时间，不指定时使用本机时区
+    try:
+        ZONE.configure(get_option('--tz'))
+    except ValueError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    
+    # 自定义文件名规则，与内置规则按优先级合并
+    if patterns := get_option('--patterns'):
+        try:
+            load_patterns(patterns)
+        except (OSError, ValueError) as e:
+            print(f"错误: 无法加载规则文件: {e}")
+            sys.exit(1)
+    REGISTRY.timing = opts.pattern_stats
+    
+    METRICS.enabled = opts.stats
+    # 进程数：--workers，其次环境变量 EXIFTOOL_WORKERS，再其次 --jobs，最后按 CPU 核数
+    workers = get_option('--workers') or os.environ.get('EXIFTOOL_WORKERS')
+    get_pool(max(1, int(workers)) if workers else opts.jobs if opts.jobs > 1 else None)
+    
+    try:
+        if opts.watch is None:
+            run(opts)
+        else:
+            watch(opts)
+    finally:
+        shutdown_pool()
+
+
+def run(opts: Options, processed: dict | None = None):
+    counts = {'renamed': 0, 'fixed': 0, 'correct': 0, 'skipped': 0, 'failed': 0, 'unchanged': 0,
+              'match': 0, 'mismatch': 0, 'unreadable': 0, 'planned': 0, 'duplicate': 0, 'linked': 0}
+    planner = RenamePlanner()
+    dry_run = opts.dry_run and not opts.verify
+    rename = opts.rename and not opts.verify
+    dedup = opts.dedup if not opts.verify else None
+    # 校验和预演都不修改文件，也不读写状态索引
+    use_state = opts.state_file and not opts.verify and not dry_run
+    state = StateIndex(opts.state_file, opts.target_dir) if use_state else None
+    jsonl = opts.format == 'jsonl'
+    # jsonl 模式下 stdout 只输出记录，汇总写到 stderr
+    report = sys.stderr if jsonl else sys.stdout
+    
+    def files():
+        for entry in METRICS.timed_iter(scan_files(opts.target_dir, opts.file_filter, opts.recursive), 'scan'):
+            f = Path(entry.path)
+            # 上次已修正且未变化的文件直接跳过，--force 时仍重新写入
+            if state is not None:
+                if state.owns(f):
+                    continue
+                if not opts.force and state.is_done(f, entry.stat()):
+                    counts['unchanged'] += 1
+                    continue
+            yield f, entry
+    
+    # --dedup 需要先收集全部文件再按内容分组；skip/link 模式下每组只处理第一个文件
+    source = files()
+    groups = []
+    duplicates = {}
+    if dedup:
+        listed = list(source)
+        with METRICS.stage('dedup'):
+            groups = duplicate_groups([(f, entry.stat().st_size) for f, entry in listed])
+        if dedup != 'report':
+            duplicates = {f: group[0] for group in groups for f in group[1:]}
+        source = iter(listed)
+    
+    def tasks():
+        seq = 0
+        chunk = []
+        for item in chain(source, [None]):
+            if item is not None:
+                chunk.append(item[0])
+                if len(chunk) < PARSE_CHUNK:
+                    continue
+            with METRICS.stage('parse'):
+                parsed = match_many([f.name for f in chunk])
+            for f, (dt, pattern) in zip(chunk, parsed):
+                if f in duplicates:
+                    yield Task(seq, f, dt, pattern=pattern, duplicate_of=duplicates[f])
+                elif dt and rename:
+                    with METRICS.stage('plan_rename'):
+                        new_path, duplicate = planner.plan(f, dt)
+                    yield Task(seq, f, dt, new_path, pattern=pattern, duplicate_of=duplicate)
                 else:
-                    print(f"✗ {f.name} (目标文件已存在)")
-                    failed += 1
+                    yield Task(seq, f, dt, pattern=pattern)
+                seq += 1
+            chunk = []
+    
+    # 重命名目标在 tasks() 中按顺序规划，结果也按原始顺序输出，保证汇总确定
+    planned = by_directory(tasks()) if rename and not dry_run else tasks()
+    batches = plan_batches(planned, opts.batch_size, opts.jobs * 4)
+    executor = ThreadPoolExecutor(max_workers=opts.jobs) if opts.jobs > 1 and not dry_run else None
+    if opts.verify:
+        handler = verify_batch
+    elif dry_run:
+        handler = plan_batch
+    else:
+        handler = partial(process_batch, force=opts.force, backend=opts.backend)
+    results = ordered_map(executor, partial(run_batch, handler), batches, opts.jobs * 4)
+    pending = {}
+    next_seq = 0
+    final = {}
+    try:
+        for batch_results in results:
+            for result in batch_results:
+                pending[result.seq] = result
+            while next_seq in pending:
+                result = pending.pop(next_seq)
+                next_seq += 1
+                print_result(result, opts.target_dir, jsonl)
+                counts['renamed'] += result.renamed
+                counts[result.status] += 1
+                if duplicates:
+                    final[result.task.path] = result.path
+                METRICS.inc('files_total', status=result.status)
+                if state is not None:
+                    state.record(result.path, result.status, result.dt)
+                if processed is not None:
+                    remember(processed, result.path)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if state is not None:
+            state.close()
+    
+    if dedup == 'link' and not dry_run:
+        # 重复文件替换为指向保留文件（处理后的路径）的硬链接
+        for f, original in duplicates.items():
+            target = final.get(original, original)
+            try:
+                linked = replace_with_link(f, target)
+            except OSError as e:
+                print(f"✗ {f.name} (硬链接失败: {e})", file=report)
+                counts['failed'] += 1
+                continue
+            if not linked:
+                continue
+            counts['linked'] += 1
+            if not jsonl:
+                print(f"⇔ {f.name} -> {target.name} (硬链接)")
+    
+    if dedup == 'report' and groups:
+        print(f"\n重复文件 {len(groups)} 组:", file=report)
+        for group in groups:
+            print(f"  {group[0].relative_to(opts.target_dir).as_posix()}", file=report)
+            for f in group[1:]:
+                print(f"    = {f.relative_to(opts.target_dir).as_posix()}", file=report)
+    
+    if opts.stats:
+        print('\n'.join(METRICS.summary()), file=report)
+    if opts.pattern_stats:
+        print('\n'.join(REGISTRY.report()), file=report)
+    
+    if opts.verify:
+        print(f"\n校验完成: 一致 {counts['match']} 个, 不一致 {counts['mismatch']} 个, "
+              f"无法读取 {counts['unreadable']} 个, 跳过 {counts['skipped']} 个", file=report)
+        return
+    
+    if dry_run:
+        summary = f"\n预演完成（未修改任何文件）: 计划写入 {counts['planned']} 个"
+        if opts.rename:
+            summary += f", 其中重命名 {counts['renamed']} 个"
+        summary += f", 跳过 {counts['skipped']} 个"
+        if counts['duplicate']:
+            summary += f", 重复 {counts['duplicate']} 个"
+        print(summary, file=report)
+        return
+    
+    renamed, fixed, skipped, failed = counts['renamed'], counts['fixed'], counts['skipped'], counts['failed']
+    if opts.rename:
+        summary = f"\n完成: 重命名 {renamed} 个, 修正 {fixed} 个, 跳过 {skipped} 个, 失败 {failed} 个"
+    else:
+        summary = f"\n完成: 修正 {fixed} 个, 跳过 {skipped} 个, 失败 {failed} 个"
+    if counts['correct']:
+        summary += f", 已正确 {counts['correct']} 个"
+    if counts['duplicate']:
+        summary += f", 重复 {counts['duplicate']} 个"
+    if counts['linked']:
+        summary += f", 硬链接 {counts['linked']} 个"
+    if state is not None:
+        summary += f", 未变化 {counts['unchanged']} 个"
+    print(summary, file=report)
+
+
+# 监听模式：待处理队列上限（超过后暂停读取事件，由内核队列或下次轮询缓冲），
+# 以及记住的已处理文件数（用于忽略自身重命名和写入产生的事件）
+WATCH_BACKLOG = 10000
+WATCH_MEMORY = 100000
+
+
+def file_key(path: Path) -> tuple[int, int] | None:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def remember(processed: dict, path: Path):
+    processed[path] = file_key(path)
+    if len(processed) > WATCH_MEMORY:
+        del processed[next(iter(processed))]
+
+
+def watch(opts: Options):
+    # 先完整处理一次已有文件，之后只处理新到达或有变化的文件，不再扫描整个目录
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+    
+    watcher = open_watcher(opts.target_dir, opts.recursive, poll=opts.watch == 'poll')
+    processed = {}
+    run(opts, processed)
+    
+    jsonl = opts.format == 'jsonl'
+    report = sys.stderr if jsonl else sys.stdout
+    kind = '轮询' if isinstance(watcher, PollingWatcher) else 'inotify'
+    print(f"\n开始监听 {opts.target_dir}（{kind}，稳定 {opts.settle:g} 秒后处理），Ctrl-C 结束", file=report)
+    
+    counts = {'renamed': 0, 'fixed': 0, 'correct': 0, 'skipped': 0, 'failed': 0, 'duplicate': 0}
+    planner = RenamePlanner()
+    state = StateIndex(opts.state_file, opts.target_dir) if opts.state_file else None
+    debouncer = Debouncer(opts.settle)
+    backlog = deque()
+    # 已进入队列或正在处理的路径（含重命名目标），期间的新事件等处理完再看
+    busy = set()
+    # 已交给线程池的文件（原路径和重命名目标），处理完成前内容可能正在改写
+    running = set()
+    futures = {}
+    executor = ThreadPoolExecutor(max_workers=opts.jobs)
+    handler = partial(run_batch, partial(process_batch, force=opts.force, backend=opts.backend))
+    seq = 0
+    
+    def wanted(f: Path) -> bool:
+        name = f.name
+        # 点开头的通常是 rsync、SMB 等拷贝过程中的临时文件，改名为正式文件名后会再次触发事件
+        if name.startswith('.') or name.endswith('_exiftool_tmp'):
+            return False
+        if state is not None and state.owns(f):
+            return False
+        if opts.file_filter is None:
+            return True
+        if not opts.file_filter.accepts(name):
+            return False
+        parts = f.relative_to(opts.target_dir).parts[:-1]
+        return not any(opts.file_filter.excludes(part) for part in parts)
+    
+    def in_use(f: Path) -> bool:
+        # 仍在等待稳定或正在处理的文件，重命名规划时不读取其内容
+        return f in debouncer or f in running
+    
+    def submit(paths: list[Path]):
+        nonlocal seq
+        with METRICS.stage('parse'):
+            parsed = match_many([f.name for f in paths])
+        tasks = []
+        for f, (dt, pattern) in zip(paths, parsed):
+            new_path = duplicate = None
+            if dt and opts.rename:
+                new_path, duplicate = planner.plan(f, dt, in_use)
+            tasks.append(Task(seq, f, dt, new_path, pattern=pattern, duplicate_of=duplicate))
+            seq += 1
+        for batch in plan_batches(tasks, opts.batch_size):
+            busy.update(task.new_path for task in batch if task.new_path)
+            running.update(path for task in batch for path in (task.path, task.new_path) if path)
+            futures[executor.submit(handler, batch)] = batch
+    
+    def collect(done):
+        for future in done:
+            batch = futures.pop(future)
+            for task in batch:
+                busy.discard(task.path)
+                busy.discard(task.new_path)
+                running.discard(task.path)
+                running.discard(task.new_path)
+                if task.new_path is not None:
+                    planner.release(task.new_path)
+            try:
+                results = future.result()
+            except OSError as e:
+                # 处理期间文件被移走或删除
+                for task in batch:
+                    print(f"✗ {task.path.name} ({e})", file=report)
+                    counts['failed'] += 1
+                continue
+            for result in results:
+                print_result(result, opts.target_dir, jsonl)
+                counts['renamed'] += result.renamed
+                counts[result.status] += 1
+                METRICS.inc('files_total', status=result.status)
+                remember(processed, result.path)
+                if state is not None:
+                    state.record(result.path, result.status, result.dt)
+        if state is not None and not futures:
+            state.commit()
+        sys.stdout.flush()
+    
+    try:
+        while True:
+            if len(backlog) < WATCH_BACKLOG:
+                paths, overflow = watcher.read(0.5 if not futures else 0.05)
+                if overflow:
+                    # 内核事件队列溢出，补扫一次目录找回丢失的事件
+                    print("! 事件队列溢出，重新扫描目录", file=report)
+                    paths = [Path(entry.path) for entry in scan_files(opts.target_dir, None, opts.recursive)]
+                for f in paths:
+                    if wanted(f):
+                        # 文件一出现就占用其文件名，避免其他文件在它稳定之前被改名到同名路径
+                        planner.add(f)
+                        debouncer.touch(f)
+            elif futures:
+                wait(futures, timeout=0.5, return_when=FIRST_COMPLETED)
+            
+            for f in debouncer.ready():
+                if f in busy:
+                    # 仍在处理中（例如刚被改名为此路径），完成后再看
+                    debouncer.touch(f)
+                    continue
+                try:
+                    st = f.stat()
+                except OSError:
+                    continue
+                # 自身重命名和写入产生的事件，以及状态索引中已修正且未变化的文件
+                if processed.get(f) == (st.st_size, st.st_mtime_ns):
                     continue
+                if state is not None and not opts.force and state.is_done(f, st):
+                    continue
+                backlog.append(f)
+                busy.add(f)
             
-            if fix_exif_time(str(f), dt):
-                if not rename_mode:
-                    print(f"✓ {f.name} -> {dt}")
-                fixed += 1
-            else:
-                print(f"✗ {f.name} (写入失败)")
-                failed += 1
-        else:
-            print(f"- {f.name} (无法解析)")
-            skipped += 1
+            collect([future for future in futures if future.done()])
+            if not futures and not backlog and not len(debouncer):
+                planner.clear_hashes()
+            in_flight = sum(len(batch) for batch in futures.values())
+            room = opts.jobs * opts.batch_size - in_flight
+            if backlog and room > 0:
+                chunk = [backlog.popleft() for _ in range(min(room, len(backlog)))]
+                busy.difference_update(f for f in chunk if not f.exists())
+                submit([f for f in chunk if f in busy])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # 已提交的任务处理完再退出，队列中未开始的文件留到下次运行
+        executor.shutdown(wait=True)
+        collect(list(futures))
+        watcher.close()
+        if state is not None:
+            state.close()
     
-    if rename_mode:
-        print(f"\n完成: 重命名 {renamed} 个, 修正 {fixed} 个, 跳过 {skipped} 个, 失败 {failed} 个")
-    else:
-        print(f"\n完成: 修正 {fixed} 个, 跳过 {skipped} 个, 失败 {failed} 个")
+    if backlog or len(debouncer):
+        print(f"\n未处理 {len(backlog) + len(debouncer)} 个文件，下次运行时处理", file=report)
+    if opts.stats:
+        print('\n'.join(METRICS.summary()), file=report)
+    if opts.pattern_stats:
+        print('\n'.join(REGISTRY.report()), file=report)
+    summary = f"\n监听结束: 修正 {counts['fixed']} 个, 跳过 {counts['skipped']} 个, 失败 {counts['failed']} 个"
+    if opts.rename:
+        summary += f", 重命名 {counts['renamed']} 个"
+    if counts['correct']:
+        summary += f", 已正确 {counts['correct']} 个"
+    if counts['duplicate']:
+        summary += f", 重复 {counts['duplicate']} 个"
+    print(summary, file=report)
 
 
 if __name__ == '__main__':
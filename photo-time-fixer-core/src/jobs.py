@@ -0,0 +1,158 @@
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import deque
+
+# 后台任务队列：上传后立即返回任务 ID，由固定数量的工作线程在后台处理；
+# 多个任务之间按文件轮转调度，大批量任务不会独占 CPU。
+# 任务也可以作为上传会话保持打开：客户端并发分批追加文件，全部上传后关闭，最后只下载一次
+
+JOB_TTL = 3600
+# 空闲的工作线程每隔这么多秒清理一次过期任务，没有新上传时临时文件也会按时删除
+EXPIRE_INTERVAL = 60
+
+
+def default_job_workers() -> int:
+    if size := os.environ.get('JOB_WORKERS'):
+        return max(1, int(size))
+    return os.cpu_count() or 1
+
+
+class Job:
+    def __init__(self, tmpdir: str, items: list, sealed: bool = True):
+        self.id = uuid.uuid4().hex
+        self.tmpdir = tmpdir
+        self.pending = deque(items)
+        self.total = len(items)
+        self.done = 0
+        self.failed = 0
+        self.results = []
+        self.status = 'queued'
+        self.sealed = sealed
+        self.finished_at = None
+        self.updated = time.time()
+        self.changed = threading.Condition()
+
+    def snapshot(self) -> dict:
+        return {
+            'id': self.id,
+            'status': self.status,
+            'total': self.total,
+            'done': self.done,
+            'failed': self.failed,
+        }
+
+    def wait(self, version: dict | None, timeout: float) -> dict:
+        # 等待进度变化，供 SSE 推送使用
+        with self.changed:
+            if self.snapshot() == version:
+                self.changed.wait(timeout)
+            return self.snapshot()
+
+
+class JobManager:
+    def __init__(self, handler, workers: int | None = None):
+        # handler(item) 返回 (文件路径, 结果文件名)
+        self.handler = handler
+        self.workers = workers or default_job_workers()
+        self._jobs = {}
+        self._queue = deque()
+        self._lock = threading.Condition()
+        self._threads = []
+
+    def _start(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._run, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, tmpdir: str, items: list, sealed: bool = True) -> Job:
+        # sealed=False 时任务保持打开，之后用 add 追加文件，seal 后才会结束
+        job = Job(tmpdir, items, sealed)
+        with self._lock:
+            self._expire()
+            self._jobs[job.id] = job
+            if items:
+                self._queue.append(job)
+                self._lock.notify()
+            else:
+                self._maybe_finish(job)
+            self._start()
+        return job
+
+    def add(self, job: Job, items: list) -> bool:
+        # 向打开的任务追加文件；任务已关闭时返回 False
+        with self._lock:
+            with job.changed:
+                if job.sealed:
+                    return False
+                job.pending.extend(items)
+                job.total += len(items)
+                job.updated = time.time()
+                job.changed.notify_all()
+            if items and job not in self._queue:
+                self._queue.append(job)
+                self._lock.notify()
+            self._start()
+        return True
+
+    def seal(self, job: Job):
+        with job.changed:
+            job.sealed = True
+        self._maybe_finish(job)
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def remove(self, job_id: str):
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            if job is not None and job in self._queue:
+                self._queue.remove(job)
+        if job is not None:
+            shutil.rmtree(job.tmpdir, ignore_errors=True)
+
+    def _expire(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            # 已完成的任务按完成时间过期，未关闭的会话按最后一次上传时间过期
+            last = job.finished_at if job.finished_at is not None else job.updated
+            if (job.finished_at is not None or not job.sealed) and now - last > JOB_TTL:
+                del self._jobs[job_id]
+                shutil.rmtree(job.tmpdir, ignore_errors=True)
+
+    def _maybe_finish(self, job: Job):
+        with job.changed:
+            if job.sealed and job.done == job.total and job.status != 'done':
+                job.status = 'done'
+                job.finished_at = time.time()
+                job.changed.notify_all()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._queue:
+                    if not self._lock.wait(EXPIRE_INTERVAL):
+                        self._expire()
+                # 轮转：每次只取队首任务的一个文件，任务还有剩余就放回队尾
+                job = self._queue.popleft()
+                item = job.pending.popleft()
+                if job.pending:
+                    self._queue.append(job)
+            with job.changed:
+                job.status = 'running'
+            try:
+                result = self.handler(item)
+            except Exception:
+                result = None
+            with job.changed:
+                if result is None:
+                    job.failed += 1
+                else:
+                    job.results.append(result)
+                job.done += 1
+                job.changed.notify_all()
+            self._maybe_finish(job)
@@ -0,0 +1,398 @@
+import mmap
+import os
+import re
+import struct
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
+
+from tz import format_offset
+
+# 定位 JPEG EXIF 与 QuickTime(MP4/MOV) 头部中的定长日期字段，只需文件开头或 moov 原子的字节
+
+# EXIF 日期为 20 字节 ASCII："YYYY:MM:DD HH:MM:SS\0"
+EXIF_DATE_TAGS = {0x0132: 'ModifyDate', 0x9003: 'DateTimeOriginal', 0x9004: 'CreateDate'}
+EXIF_IFD_POINTER = 0x8769
+EXIF_DATE_SIZE = 20
+# OffsetTime 为 7 字节 ASCII："+08:00\0"；只在显式指定时区（dt 带 tzinfo）时写入和校验
+EXIF_OFFSET_TAGS = {0x9010: 'OffsetTime', 0x9011: 'OffsetTimeOriginal', 0x9012: 'OffsetTimeDigitized'}
+EXIF_OFFSET_SIZE = 7
+
+# QuickTime 日期为 1904-01-01 起的秒数，按 exiftool 默认行为不做时区换算
+QT_EPOCH = datetime(1904, 1, 1)
+QT_DATE_ATOMS = {
+    b'mvhd': ('CreateDate', 'ModifyDate'),
+    b'tkhd': ('TrackCreateDate', 'TrackModifyDate'),
+    b'mdhd': ('MediaCreateDate', 'MediaModifyDate'),
+}
+QT_CONTAINERS = {b'moov', b'trak', b'mdia', b'udta'}
+# moov/meta（Keys + ItemList）与 udta 中的日期为 ISO 8601 文本，如 "2023-11-14T22:13:20+0800"，
+# 只有宽度固定的几种格式可以原地改写：无时区(19)、Z(20)、+0800(24)、+08:00(25)
+QT_KEY_DATES = {b'com.apple.quicktime.creationdate': 'CreationDate'}
+QT_ITEM_DATES = {b'\xa9day': 'ContentCreateDate'}
+QT_TEXT_WIDTHS = (19, 20, 24, 25)
+_RE_QT_DATE = re.compile(rb'(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(Z|[+-]\d{2}:?\d{2})?')
+JPEG_HEADER_SIZE = 128 * 1024
+
+# 判断“已正确”时必须存在的标签，缺失时 exiftool 会补写，不能跳过
+REQUIRED_TAGS = {
+    'jpeg': {'ModifyDate', 'DateTimeOriginal', 'CreateDate'},
+    'quicktime': {'CreateDate', 'ModifyDate'},
+}
+OFFSET_TAGS = set(EXIF_OFFSET_TAGS.values())
+QT_TOP_LEVEL = {b'ftyp', b'moov', b'mdat', b'free', b'skip', b'wide', b'pnot', b'uuid', b'meta'}
+
+
+class DateField(NamedTuple):
+    tag: str
+    offset: int
+    size: int
+    # QuickTime 元数据中的文本日期；格式无法原地改写时 size 为 0
+    text: bool = False
+
+
+def _exif_fields(buf, tiff: int, end: int, base: int) -> list[DateField]:
+    order = buf[tiff:tiff + 2]
+    if order == b'II':
+        fmt = '<'
+    elif order == b'MM':
+        fmt = '>'
+    else:
+        return []
+
+    fields = []
+
+    def read_ifd(offset: int, depth: int):
+        pos = tiff + offset
+        if depth > 1 or pos + 2 > end:
+            return
+        count = struct.unpack_from(fmt + 'H', buf, pos)[0]
+        for i in range(count):
+            entry = pos + 2 + 12 * i
+            if entry + 12 > end:
+                return
+            tag, typ, n, value = struct.unpack_from(fmt + 'HHII', buf, entry)
+            if tag in EXIF_DATE_TAGS and typ == 2 and n == EXIF_DATE_SIZE:
+                if tiff + value + EXIF_DATE_SIZE <= end:
+                    fields.append(DateField(EXIF_DATE_TAGS[tag], base + tiff + value, EXIF_DATE_SIZE))
+            elif tag in EXIF_OFFSET_TAGS and typ == 2 and n == EXIF_OFFSET_SIZE:
+                if tiff + value + EXIF_OFFSET_SIZE <= end:
+                    fields.append(DateField(EXIF_OFFSET_TAGS[tag], base + tiff + value, EXIF_OFFSET_SIZE))
+            elif tag == EXIF_IFD_POINTER:
+                read_ifd(value, depth + 1)
+
+    if tiff + 8 <= end:
+        read_ifd(struct.unpack_from(fmt + 'I', buf, tiff + 4)[0], 0)
+    return fields
+
+
+def jpeg_date_fields(buf, base: int = 0) -> list[DateField]:
+    if buf[:2] != b'\xff\xd8':
+        return []
+    pos = 2
+    end = len(buf)
+    while pos + 4 <= end:
+        if buf[pos] != 0xFF:
+            break
+        marker = buf[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            break
+        length = struct.unpack_from('>H', buf, pos + 2)[0]
+        if marker == 0xE1 and buf[pos + 4:pos + 10] == b'Exif\x00\x00':
+            return _exif_fields(buf, pos + 10, min(end, pos + 2 + length), base)
+        pos += 2 + length
+    return []
+
+
+def _atoms(buf, start: int, end: int):
+    # 依次产出 (类型, 原子起点, 内容起点, 原子终点)，遇到损坏的原子即停止
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack_from('>I4s', buf, pos)
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                return
+            size = struct.unpack_from('>Q', buf, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            return
+        yield kind, pos, pos + header, pos + size
+        pos += size
+
+
+def _text_field(buf, tag: str, start: int, end: int, base: int) -> DateField:
+    size = end - start
+    if size not in QT_TEXT_WIDTHS or not _RE_QT_DATE.fullmatch(bytes(buf[start:end])):
+        size = 0
+    return DateField(tag, base + start, size, True)
+
+
+def _data_field(buf, tag: str, start: int, end: int, base: int, fields: list[DateField]):
+    # ItemList 条目内的 data 原子：类型(4) + 语言(4) + 值，类型 1 为 UTF-8 文本
+    for kind, _, body, stop in _atoms(buf, start, end):
+        if kind == b'data' and body + 8 <= stop:
+            if struct.unpack_from('>I', buf, body)[0] == 1:
+                fields.append(_text_field(buf, tag, body + 8, stop, base))
+            else:
+                fields.append(DateField(tag, base + body, 0, True))
+
+
+def _qt_meta(buf, start: int, end: int, base: int, fields: list[DateField]):
+    # QuickTime 的 meta 直接包含子原子，MP4/iTunes 的 meta 先有 4 字节版本和标志
+    if buf[start + 4:start + 8] != b'hdlr' and buf[start + 8:start + 12] == b'hdlr':
+        start += 4
+    keys = []
+    for kind, _, body, stop in _atoms(buf, start, end):
+        if kind == b'keys' and body + 8 <= stop:
+            keys = [bytes(buf[entry + 8:entry_end]) for _, entry, _, entry_end in _atoms(buf, body + 8, stop)]
+    for kind, _, body, stop in _atoms(buf, start, end):
+        if kind != b'ilst':
+            continue
+        for item, _, item_body, item_end in _atoms(buf, body, stop):
+            # 有 keys 时条目类型为从 1 开始的键序号
+            index = int.from_bytes(item, 'big') - 1
+            if keys and 0 <= index < len(keys):
+                tag = QT_KEY_DATES.get(keys[index])
+            else:
+                tag = QT_ITEM_DATES.get(item)
+            if tag is not None:
+                _data_field(buf, tag, item_body, item_end, base, fields)
+
+
+def _qt_walk(buf, start: int, end: int, base: int, fields: list[DateField]):
+    for kind, _, body, stop in _atoms(buf, start, end):
+        if kind in QT_CONTAINERS:
+            _qt_walk(buf, body, stop, base, fields)
+        elif kind == b'meta':
+            _qt_meta(buf, body, stop, base, fields)
+        elif kind in QT_ITEM_DATES and body + 4 <= stop:
+            # udta 中的文本条目：长度(2) + 语言(2) + 文本
+            length = struct.unpack_from('>H', buf, body)[0]
+            fields.append(_text_field(buf, QT_ITEM_DATES[kind], body + 4, min(body + 4 + length, stop), base))
+        elif kind in QT_DATE_ATOMS and body + 4 <= stop:
+            width = 8 if buf[body] == 1 else 4
+            create_tag, modify_tag = QT_DATE_ATOMS[kind]
+            if body + 4 + 2 * width <= stop:
+                fields.append(DateField(create_tag, base + body + 4, width))
+                fields.append(DateField(modify_tag, base + body + 4 + width, width))
+
+
+def quicktime_date_fields(buf, base: int = 0) -> list[DateField]:
+    # buf 可以是整个文件，也可以是从 base 偏移开始的 moov 原子
+    if buf[4:8] not in QT_TOP_LEVEL:
+        return []
+    fields = []
+    _qt_walk(buf, 0, len(buf), base, fields)
+    return fields
+
+
+def find_date_fields(buf, base: int = 0) -> list[DateField]:
+    if base == 0 and buf[:2] == b'\xff\xd8':
+        return jpeg_date_fields(buf)
+    return quicktime_date_fields(buf, base)
+
+
+def encode_date(field: DateField, dt: datetime) -> bytes | None:
+    if field.text:
+        return _encode_text(field, dt)
+    if field.size == EXIF_DATE_SIZE:
+        return dt.strftime('%Y:%m:%d %H:%M:%S').encode('ascii') + b'\x00'
+    if field.size == EXIF_OFFSET_SIZE:
+        # 由调用方保证 dt 带 tzinfo
+        return _offset_text(dt).encode('ascii') + b'\x00'
+    seconds = int((dt.replace(tzinfo=None, microsecond=0) - QT_EPOCH).total_seconds())
+    if seconds < 0 or seconds >= 1 << (8 * field.size):
+        return None
+    return seconds.to_bytes(field.size, 'big')
+
+
+def _offset_text(dt: datetime) -> str:
+    return format_offset(int(dt.utcoffset().total_seconds()))
+
+
+def _local(dt: datetime) -> datetime:
+    # 不带时区的 dt 按本机时区解释（与未指定 --tz 时的换算一致）
+    return (dt if dt.tzinfo is not None else dt.astimezone()).replace(microsecond=0)
+
+
+def _encode_text(field: DateField, dt: datetime) -> bytes | None:
+    # 按原有格式写回，宽度不变
+    local = _local(dt)
+    if field.size == 19:
+        text = local.strftime('%Y-%m-%dT%H:%M:%S')
+    elif field.size == 20:
+        text = (local - local.utcoffset()).strftime('%Y-%m-%dT%H:%M:%S') + 'Z'
+    elif field.size in (24, 25):
+        offset = _offset_text(local)
+        text = local.strftime('%Y-%m-%dT%H:%M:%S') + (offset if field.size == 25 else offset.replace(':', ''))
+    else:
+        return None
+    return text.encode('ascii')
+
+
+def _decode_text(data: bytes) -> datetime | None:
+    # 带时区后缀时返回带 tzinfo 的时间，按时刻比较
+    m = _RE_QT_DATE.fullmatch(data)
+    if not m:
+        return None
+    try:
+        value = datetime(*(int(g) for g in m.groups()[:6]))
+    except ValueError:
+        return None
+    suffix = m.group(7)
+    if suffix is None:
+        return value
+    if suffix == b'Z':
+        return value.replace(tzinfo=timezone.utc)
+    digits = suffix[1:].replace(b':', b'')
+    seconds = int(digits[:2]) * 3600 + int(digits[2:]) * 60
+    return value.replace(tzinfo=timezone(timedelta(seconds=-seconds if suffix[:1] == b'-' else seconds)))
+
+
+def _required(kind: str, dt: datetime) -> set[str]:
+    if kind == 'jpeg' and dt.tzinfo is not None:
+        return REQUIRED_TAGS[kind] | OFFSET_TAGS
+    return REQUIRED_TAGS[kind]
+
+
+def _patches(fields: list[DateField], dt: datetime) -> list[tuple[int, bytes]] | None:
+    # 缺少必需标签、格式不支持或时间无法编码时返回 None；dt 不带时区时不改动 OffsetTime
+    if not fields or _required(_kind(fields), dt) - {field.tag for field in fields}:
+        return None
+    patches = []
+    for field in fields:
+        if field.size == EXIF_OFFSET_SIZE and dt.tzinfo is None:
+            continue
+        data = encode_date(field, dt)
+        if data is None:
+            return None
+        patches.append((field.offset, data))
+    return patches
+
+
+def date_patches(buf, dt: datetime, base: int = 0) -> list[tuple[int, bytes]] | None:
+    # 返回 [(文件偏移, 新字节)]，补丁与原字段等长；规则与 patch_file 相同，无法修补时返回 None
+    return _patches(find_date_fields(buf, base), dt)
+
+
+def decode_date(buf, field: DateField) -> datetime | str | None:
+    return _decode(field, bytes(buf[field.offset:field.offset + field.size]))
+
+
+def _decode(field: DateField, data: bytes) -> datetime | str | None:
+    # OffsetTime 返回原始字符串
+    if field.text:
+        return _decode_text(data)
+    if field.size == EXIF_OFFSET_SIZE:
+        return data[:6].decode('ascii', 'replace') if data[:1] in (b'+', b'-') else None
+    if field.size == EXIF_DATE_SIZE:
+        try:
+            return datetime.strptime(data[:19].decode('ascii'), '%Y:%m:%d %H:%M:%S')
+        except (UnicodeDecodeError, ValueError):
+            return None
+    seconds = int.from_bytes(data, 'big')
+    if seconds == 0:
+        return None
+    try:
+        return QT_EPOCH + timedelta(seconds=seconds)
+    except OverflowError:
+        return None
+
+
+def _read_header(f) -> tuple[bytes, int]:
+    # 无法 mmap 时的回退：JPEG 读开头，QuickTime 沿顶层原子 seek 到 moov 只读取 moov
+    f.seek(0)
+    head = f.read(16)
+    if head[:2] == b'\xff\xd8':
+        return head + f.read(JPEG_HEADER_SIZE - len(head)), 0
+    pos = 0
+    while len(head) >= 8:
+        size, kind = struct.unpack_from('>I4s', head)
+        if size == 1 and len(head) >= 16:
+            size = struct.unpack_from('>Q', head, 8)[0]
+        elif size == 0:
+            f.seek(0, 2)
+            size = f.tell() - pos
+        if size < 8:
+            break
+        if kind == b'moov':
+            f.seek(pos)
+            return f.read(size), pos
+        pos += size
+        f.seek(pos)
+        head = f.read(16)
+    return b'', 0
+
+
+def _file_fields(f) -> list[tuple[DateField, bytes]]:
+    # 只读取头部字节（mmap 按需分页），返回每个日期字段及其当前内容
+    try:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, OSError):
+        header, base = _read_header(f)
+        return [(field, header[field.offset - base:field.offset - base + field.size])
+                for field in find_date_fields(header, base)]
+    with buf:
+        return [(field, buf[field.offset:field.offset + field.size]) for field in find_date_fields(buf)]
+
+
+def _kind(fields: list[DateField]) -> str:
+    return 'jpeg' if not fields[0].text and fields[0].size in (EXIF_DATE_SIZE, EXIF_OFFSET_SIZE) else 'quicktime'
+
+
+def read_dates(path) -> tuple[str, list[tuple[str, datetime | str | None]]] | None:
+    # 返回 (格式, [(标签, 时间)])；不支持的格式返回 None
+    with open(path, 'rb') as f:
+        found = _file_fields(f)
+    if not found:
+        return None
+    return _kind([field for field, _ in found]), [(field.tag, _decode(field, data)) for field, data in found]
+
+
+def date_mismatches(path, dt: datetime) -> list[tuple[str, datetime | str | None]] | None:
+    # 返回与 dt 不一致或缺失的标签；空列表表示内嵌时间已正确，None 表示无法读取
+    # dt 带 tzinfo 时同时校验 OffsetTime 标签
+    result = read_dates(path)
+    if result is None:
+        return None
+    kind, dates = result
+    expected = dt.replace(tzinfo=None, microsecond=0)
+    offset = _offset_text(dt) if dt.tzinfo is not None else None
+    mismatches = []
+    for tag, value in dates:
+        if tag in OFFSET_TAGS:
+            if offset is not None and value != offset:
+                mismatches.append((tag, value))
+        elif isinstance(value, datetime) and value.tzinfo is not None:
+            # QuickTime 文本日期带时区时按时刻比较
+            if value != _local(dt):
+                mismatches.append((tag, value))
+        elif value != expected:
+            mismatches.append((tag, value))
+    found = {tag for tag, _ in dates}
+    mismatches.extend((tag, None) for tag in sorted(_required(kind, dt) - found))
+    return mismatches
+
+
+def patch_file(path, dt: datetime) -> bool:
+    # 原地改写已有的定长日期字段，只写入几十个字节，不复制整个文件；
+    # 缺少必需标签、格式不支持或时间无法编码时返回 False，由调用方回退到 exiftool
+    with open(path, 'r+b') as f:
+        patches = _patches([field for field, _ in _file_fields(f)], dt)
+        if patches is None:
+            return False
+        for offset, data in patches:
+            if hasattr(os, 'pwrite'):
+                os.pwrite(f.fileno(), data, offset)
+            else:
+                f.seek(offset)
+                f.write(data)
+    return True
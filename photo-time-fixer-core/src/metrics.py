@@ -0,0 +1,168 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# 分阶段计时与计数：命令行 --stats 打印直方图摘要，Web 版通过 /metrics 以 Prometheus 文本格式导出。
+# 未启用时 stage/observe/inc 直接返回，不产生额外开销
+
+PREFIX = 'photo_time_fixer'
+
+# 对数刻度的桶上界（秒），覆盖 100 微秒到 50 秒
+BUCKETS = tuple(m * 10 ** e for e in range(-4, 2) for m in (1, 2.5, 5))
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, q: float) -> float:
+        # 按桶内线性插值估算分位数，落在最后一个桶时取观测到的最大值
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                if i == len(self.buckets):
+                    return self.max
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = min(self.buckets[i], self.max)
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.max
+
+
+class Metrics:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def observe(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if (hist := self._histograms.get(key)) is None:
+                hist = self._histograms[key] = Histogram()
+            hist.observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    @contextmanager
+    def stage(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - start, stage=name)
+
+    def timed_iter(self, iterable, stage: str):
+        # 统计生成器每次产出的耗时，用于边遍历边处理的目录扫描
+        it = iter(iterable)
+        while True:
+            with self.stage(stage):
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+            yield item
+
+    def counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def histogram(self, name: str, **labels) -> Histogram | None:
+        with self._lock:
+            return self._histograms.get((name, tuple(sorted(labels.items()))))
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+            typed = set()
+            for (name, labels), value in counters:
+                if name not in typed:
+                    lines.append(f'# TYPE {PREFIX}_{name} counter')
+                    typed.add(name)
+                lines.append(f'{PREFIX}_{name}{_labels(labels)} {value:g}')
+            for (name, labels), hist in histograms:
+                if name not in typed:
+                    lines.append(f'# TYPE {PREFIX}_{name} histogram')
+                    typed.add(name)
+                cumulative = 0
+                for bound, n in zip(_bucket_labels(hist), hist.counts):
+                    cumulative += n
+                    lines.append(f'{PREFIX}_{name}_bucket{_labels(labels + (("le", bound),))} {cumulative}')
+                lines.append(f'{PREFIX}_{name}_sum{_labels(labels)} {hist.sum:.6f}')
+                lines.append(f'{PREFIX}_{name}_count{_labels(labels)} {hist.count}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> list[str]:
+        # 命令行 --stats 输出：各阶段耗时、单文件耗时直方图、exiftool 失败率和处理字节数
+        lines = ['', '阶段耗时:', f"  {'阶段':<16}{'次数':>6}{'总计(s)':>8}{'p50(ms)':>10}{'p90(ms)':>10}{'p99(ms)':>10}"]
+        with self._lock:
+            stages = sorted((dict(labels)['stage'], hist) for (name, labels), hist in self._histograms.items()
+                            if name == 'stage_seconds')
+        for stage, hist in stages:
+            lines.append(f'  {stage:<18}{hist.count:>8}{hist.sum:>10.3f}{hist.percentile(0.5) * 1000:>10.2f}'
+                         f'{hist.percentile(0.9) * 1000:>10.2f}{hist.percentile(0.99) * 1000:>10.2f}')
+
+        if (hist := self.histogram('file_seconds')) is not None and hist.count:
+            lines.append('')
+            lines.append(f'单文件耗时: p50 {hist.percentile(0.5) * 1000:.2f} ms, p90 {hist.percentile(0.9) * 1000:.2f} ms, '
+                         f'p99 {hist.percentile(0.99) * 1000:.2f} ms, 最大 {hist.max * 1000:.2f} ms')
+            peak = max(hist.counts)
+            for bound, n in zip(_bucket_labels(hist), hist.counts):
+                if n:
+                    label = f'≤{float(bound) * 1000:g}ms' if bound != '+Inf' else f'>{hist.buckets[-1] * 1000:g}ms'
+                    lines.append(f'  {label:>10} {"█" * max(1, round(n * 40 / peak)):<40} {n}')
+
+        sent = self.counter('exiftool_files_total')
+        failed = self.counter('exiftool_failed_files_total')
+        rate = f'{failed / sent:.1%}' if sent else '-'
+        lines.append('')
+        lines.append(f'exiftool: 调用 {self.counter("exiftool_calls_total"):g} 次, 写入 {sent:g} 个文件, '
+                     f'失败 {failed:g} 个 (失败率 {rate})')
+        lines.append(f'处理字节: {self.counter("bytes_processed_total") / 1024 / 1024:,.1f} MB')
+        return lines
+
+
+def _bucket_labels(hist: Histogram) -> list[str]:
+    return [f'{b:g}' for b in hist.buckets] + ['+Inf']
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+
+# 进程内共享的指标实例，由命令行或服务端决定是否启用
+METRICS = Metrics()
@@ -0,0 +1,482 @@
+import os
+import re
+import time
+from datetime import datetime
+from typing import Callable, NamedTuple
+
+from tz import ZONE
+
+# 命令行和 Web 版共用的解析与 EXIF 写入逻辑
+# subprocess、pathlib 等按需导入，保持模块导入足够快
+
+
+def _stem(filename: str) -> str:
+    # 等价于 Path(filename).stem，不含路径分隔符时避免构造 Path
+    if '/' in filename or os.sep in filename or (os.altsep and os.altsep in filename):
+        from pathlib import Path
+        return Path(filename).stem
+    if filename == '.':
+        return ''
+    i = filename.rfind('.')
+    if 0 < i < len(filename) - 1:
+        return filename[:i]
+    return filename
+
+
+def _from_ms(digits: str) -> datetime:
+    return ZONE.from_epoch(int(digits) / 1000)
+
+
+def _from_14(digits: str) -> datetime:
+    # 等价于 strptime(digits, '%Y%m%d%H%M%S')；非 ASCII 数字交给 strptime 保证行为一致
+    if not digits.isascii():
+        return datetime.strptime(digits, '%Y%m%d%H%M%S')
+    return datetime(int(digits[:4]), int(digits[4:6]), int(digits[6:8]),
+                    int(digits[8:10]), int(digits[10:12]), int(digits[12:14]))
+
+
+def _from_13_last(name: str) -> datetime | None:
+    # 通用：13位毫秒时间戳（优先匹配最后一个）
+    found = None
+    for m in _RE_MS.finditer(name):
+        ts = int(m.group(1)) / 1000
+        if 1000000000 < ts < 2000000000:
+            found = ts
+    return ZONE.from_epoch(found) if found is not None else None
+
+
+def _from_10(m: re.Match) -> datetime | None:
+    ts = int(m.group(1))
+    if 1000000000 < ts < 2000000000:
+        return ZONE.from_epoch(ts)
+    return None
+
+
+_RE_MS = re.compile(r'(\d{13})')
+
+
+class Rule(NamedTuple):
+    # prefix 不为 None 的规则用 match，只有文件名以该前缀开头时才尝试；其余用 search
+    # build 为 None 时由 _from_13_last 遍历全部匹配（13位毫秒时间戳规则）
+    # exclusive 表示与其他规则不会同时命中，允许按命中次数调整顺序
+    name: str
+    prefix: str | None
+    regex: re.Pattern
+    build: Callable | None
+    priority: int = 0
+    exclusive: bool = False
+
+
+# 内置解析规则，按优先级从高到低排列
+_BUILTIN = [
+    # mmexport + 13位毫秒时间戳
+    ('mmexport', 'mmexport', re.compile(r'mmexport(\d{13})'), lambda m: _from_ms(m.group(1))),
+    # mmexport_ + 13位毫秒时间戳
+    ('mmexport_', 'mmexport', re.compile(r'mmexport_(\d{13})'), lambda m: _from_ms(m.group(1))),
+    # lv_xxx_YYYYMMDDHHMMSS
+    ('suffix_14', None, re.compile(r'_(\d{14})$'), lambda m: _from_14(m.group(1))),
+    # petal_YYYYMMDD_HHMMSS
+    ('petal', 'petal_', re.compile(r'petal_(\d{8})_(\d{6})'), lambda m: _from_14(m.group(1) + m.group(2))),
+    # TG-YYYY-MM-DD-HHMMSS
+    ('telegram', 'TG-', re.compile(r'TG-(\d{4})-(\d{2})-(\d{2})-(\d{6})'), lambda m: _from_14(''.join(m.groups()))),
+    # 微信图片_YYYYMMDDHHMMSS_xxx_xx
+    ('wechat', '微信图片_', re.compile(r'微信图片_(\d{14})'), lambda m: _from_14(m.group(1))),
+    # VID_YYYYMMDD_HHMMSS
+    ('vid', 'VID_', re.compile(r'VID_(\d{8})_(\d{6})'), lambda m: _from_14(m.group(1) + m.group(2))),
+    # 通用：YYYYMMDD_HHMMSS 或 YYYYMMDDHHMMSS
+    ('datetime', None, re.compile(r'(20\d{2})(0[1-9]|1[0-2])(0[1-9]|[12]\d|3[01])[_-]?(\d{6})'),
+     lambda m: _from_14(''.join(m.groups()))),
+    # 通用：YYYY-MM-DD 或 YYYY_MM_DD
+    ('date', None, re.compile(r'(20\d{2})[-_](0[1-9]|1[0-2])[-_](0[1-9]|[12]\d|3[01])'),
+     lambda m: datetime(int(m.group(1)), int(m.group(2)), int(m.group(3)), 12, 0, 0)),
+    # Notepad_YYYYMMDDHHMM_xxx 或 vp_output_YYYYMMDDHHMM
+    ('minute', None, re.compile(r'_(20\d{2})(0[1-9]|1[0-2])(0[1-9]|[12]\d|3[01])([01]\d|2[0-3])([0-5]\d)'),
+     lambda m: datetime(int(m.group(1)), int(m.group(2)), int(m.group(3)), int(m.group(4)), int(m.group(5)), 0)),
+    # 通用：13位毫秒时间戳，遍历全部匹配
+    ('timestamp_ms', None, _RE_MS, None),
+    # 通用：10位秒时间戳
+    ('timestamp', None, re.compile(r'(\d{10})'), _from_10),
+    # video_YYMMDD_HHMMSS
+    ('video', 'video_', re.compile(r'video_(\d{2})(\d{2})(\d{2})_(\d{2})(\d{2})(\d{2})'),
+     lambda m: datetime(2000 + int(m.group(1)), int(m.group(2)), int(m.group(3)),
+                        int(m.group(4)), int(m.group(5)), int(m.group(6)))),
+]
+# 内置规则优先级依次为 130、120 … 10，自定义规则可插入其间
+BUILTIN_RULES = [Rule(name, prefix, regex, build, (len(_BUILTIN) - i) * 10)
+                 for i, (name, prefix, regex, build) in enumerate(_BUILTIN)]
+BUILTIN_NAMES = {rule.name for rule in BUILTIN_RULES}
+# 内置规则的正则对象，用于判断规则是否仍是内置的匹配逻辑（只改优先级时正则不变）
+_BUILTIN_REGEXES = {id(rule.regex) for rule in BUILTIN_RULES}
+
+# 内置规则都至少需要 4 位连续数字；加载了自定义正则（包括替换内置规则的正则）时不做此预检
+_RE_HAS_DIGITS = re.compile(r'\d{4}')
+# 每解析这么多个文件名，按命中次数调整一次规则顺序
+REORDER_EVERY = 4096
+
+
+def rules_conflict(a: Rule, b: Rule) -> bool:
+    # 可能同时命中同一文件名的两条规则不能交换顺序；前缀互不包含的两条规则不会同时命中
+    if a.prefix and b.prefix and not (a.prefix.startswith(b.prefix) or b.prefix.startswith(a.prefix)):
+        return False
+    return not (a.exclusive or b.exclusive)
+
+
+def _adaptive_order(items: list, heat, conflict) -> list:
+    # 只交换相邻且不冲突的两项，冲突的规则之间保持原有先后；命中多的尽量靠前
+    items = list(items)
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(items) - 1):
+            a, b = items[i], items[i + 1]
+            if heat(b) > heat(a) and not conflict(a, b):
+                items[i], items[i + 1] = b, a
+                changed = True
+    return items
+
+
+class PatternRegistry:
+    def __init__(self, rules: list[Rule]):
+        self.configure(rules)
+
+    def configure(self, rules: list[Rule]):
+        # 按优先级排序（同优先级保持给定顺序），并清空统计
+        self.rules = sorted(rules, key=lambda rule: -rule.priority)
+        self._index = {rule.name: i for i, rule in enumerate(self.rules)}
+        self.hits = [0] * len(self.rules)
+        self.attempts = [0] * len(self.rules)
+        self.seconds = [0.0] * len(self.rules)
+        self.unmatched = 0
+        # --pattern-stats 时才统计每条规则的尝试次数和耗时
+        self.timing = False
+        self._gate = _RE_HAS_DIGITS if all(id(rule.regex) in _BUILTIN_REGEXES for rule in self.rules) else None
+        self._countdown = REORDER_EVERY
+        self._build(list(range(len(self.rules))))
+
+    def _build(self, order: list[int]):
+        # 每个前缀对应一张去掉了不相关 match 规则的规则表；文件名以多个前缀开头时取最长的一个
+        self.order = order
+        rules = self.rules
+        prefixes = sorted({rule.prefix for rule in rules if rule.prefix}, key=len, reverse=True)
+        heat = {p: sum(self.hits[i] for i, rule in enumerate(rules) if rule.prefix == p) for p in prefixes}
+        prefixes = _adaptive_order(prefixes, heat.get, lambda a, b: a.startswith(b) or b.startswith(a))
+        prefix = re.compile('|'.join(re.escape(p) for p in prefixes)).match if prefixes else None
+        tables = {}
+        for key in [None, *prefixes]:
+            table = []
+            for i in order:
+                rule = rules[i]
+                if rule.prefix is not None and (key is None or not key.startswith(rule.prefix)):
+                    continue
+                find = rule.regex.match if rule.prefix else rule.regex.search
+                table.append((find if rule.build is not None else _from_13_last, rule.build, i, rule.name))
+            tables[key] = table
+        # 热路径只读取这一个属性
+        self._state = (prefix, tables)
+
+    def reorder(self):
+        order = _adaptive_order(self.order, self.hits.__getitem__,
+                                lambda a, b: rules_conflict(self.rules[a], self.rules[b]))
+        if order != self.order or self._state[0] is not None:
+            self._build(order)
+
+    def match(self, filename: str) -> tuple[datetime | None, str | None]:
+        self._countdown -= 1
+        if self._countdown <= 0:
+            self._countdown = REORDER_EVERY
+            self.reorder()
+        name = _stem(filename)
+        if self._gate is not None and not self._gate.search(name):
+            self.unmatched += 1
+            return None, None
+        prefix, tables = self._state
+        m = prefix(name) if prefix is not None else None
+        table = tables[m.group() if m else None]
+        if self.timing:
+            return self._match_timed(name, table)
+        for find, build, i, rule in table:
+            if build is None:
+                dt = find(name)
+            elif m := find(name):
+                dt = build(m)
+            else:
+                continue
+            if dt is not None:
+                self.hits[i] += 1
+                return dt, rule
+        self.unmatched += 1
+        return None, None
+
+    def _match_timed(self, name: str, table) -> tuple[datetime | None, str | None]:
+        for find, build, i, rule in table:
+            start = time.perf_counter()
+            try:
+                if build is None:
+                    dt = find(name)
+                else:
+                    dt = build(m) if (m := find(name)) else None
+            finally:
+                self.attempts[i] += 1
+                self.seconds[i] += time.perf_counter() - start
+            if dt is not None:
+                self.hits[i] += 1
+                return dt, rule
+        self.unmatched += 1
+        return None, None
+
+    def report(self) -> list[str]:
+        # --pattern-stats 输出：当前顺序下每条规则的命中、尝试次数和耗时
+        parsed = sum(self.hits) + self.unmatched
+        lines = ['', f'文件名规则（共解析 {parsed} 个，未匹配 {self.unmatched} 个）:',
+                 f"  {'规则':<14}{'优先级':>5}{'命中':>8}{'尝试':>8}{'命中率':>8}{'总计(ms)':>10}{'平均(µs)':>10}"]
+        for i in self.order:
+            rule = self.rules[i]
+            attempts = self.attempts[i]
+            rate = f'{self.hits[i] / attempts:.1%}' if attempts else '-'
+            avg = f'{self.seconds[i] / attempts * 1e6:.2f}' if attempts else '-'
+            lines.append(f'  {rule.name:<16}{rule.priority:>8}{self.hits[i]:>10}{attempts:>10}{rate:>11}'
+                         f'{self.seconds[i] * 1000:>12.2f}{avg:>12}')
+        return lines
+
+
+REGISTRY = PatternRegistry(BUILTIN_RULES)
+
+
+# 自定义规则的取值方式：datetime 按 format 解析各捕获组拼接后的字符串，epoch/epoch_ms 为秒/毫秒时间戳
+EXTRACTORS = ('datetime', 'epoch', 'epoch_ms')
+
+
+def _custom_build(extract: str, fmt: str) -> Callable:
+    def build(m: re.Match) -> datetime:
+        text = ''.join(g for g in m.groups() if g is not None) if m.re.groups else m.group()
+        if extract == 'epoch':
+            return ZONE.from_epoch(int(text))
+        if extract == 'epoch_ms':
+            return ZONE.from_epoch(int(text) / 1000)
+        if fmt == '%Y%m%d%H%M%S' and len(text) == 14:
+            return _from_14(text)
+        return datetime.strptime(text, fmt)
+    return build
+
+
+def load_rules(path) -> list[Rule]:
+    # 配置文件为 JSON 数组，每项一条规则：
+    #   {"name": "dji", "prefix": "DJI_", "regex": "DJI_(\\d{14})", "priority": 150}
+    # 可选字段 extract（datetime/epoch/epoch_ms，默认 datetime）、format（默认 %Y%m%d%H%M%S）、
+    # exclusive；name 与内置规则相同时只修改其 priority/exclusive，"enabled": false 可停用内置规则
+    import json
+
+    with open(path, encoding='utf-8') as f:
+        entries = json.load(f)
+    if not isinstance(entries, list):
+        raise ValueError(f'{path}: 应为规则数组')
+    rules = {rule.name: rule for rule in BUILTIN_RULES}
+    for entry in entries:
+        name = entry.get('name') if isinstance(entry, dict) else None
+        if not name:
+            raise ValueError(f'{path}: 规则缺少 name')
+        if name in BUILTIN_NAMES and 'regex' not in entry:
+            if entry.get('enabled', True) is False:
+                rules.pop(name, None)
+            elif name in rules:
+                rule = rules[name]
+                rules[name] = rule._replace(priority=int(entry.get('priority', rule.priority)),
+                                            exclusive=bool(entry.get('exclusive', rule.exclusive)))
+            continue
+        extract = entry.get('extract', 'datetime')
+        if extract not in EXTRACTORS:
+            raise ValueError(f"{path}: 规则 {name} 的 extract 只能是 {'/'.join(EXTRACTORS)}")
+        try:
+            regex = re.compile(entry['regex'])
+        except (KeyError, TypeError, re.error) as e:
+            raise ValueError(f'{path}: 规则 {name} 的 regex 无效: {e}') from None
+        prefix = entry.get('prefix') or None
+        if prefix is not None and not regex.pattern.startswith((prefix, re.escape(prefix))):
+            # 前缀规则用 match 从文件名开头匹配，正则须以该前缀开头
+            raise ValueError(f'{path}: 规则 {name} 的 regex 应以 prefix 开头')
+        rules[name] = Rule(name, prefix, regex, _custom_build(extract, entry.get('format', '%Y%m%d%H%M%S')),
+                           int(entry.get('priority', 0)), bool(entry.get('exclusive', False)))
+    return list(rules.values())
+
+
+def load_patterns(path):
+    # 命令行 --patterns 和服务端 PHOTO_PATTERNS 在启动时调用
+    REGISTRY.configure(load_rules(path))
+
+
+def match_filename(filename: str) -> tuple[datetime | None, str | None]:
+    # 返回 (解析时间, 命中的规则名称)，无法解析时为 (None, None)
+    return REGISTRY.match(filename)
+
+
+def parse_time_from_filename(filename: str) -> datetime | None:
+    return REGISTRY.match(filename)[0]
+
+
+def parse_many(names: list[str]) -> list[datetime | None]:
+    # 批量解析，单个文件名日期非法（ValueError）时视为无法解析，不影响整批
+    results = []
+    for name in names:
+        try:
+            results.append(parse_time_from_filename(name))
+        except ValueError:
+            results.append(None)
+    return results
+
+
+def match_many(names: list[str]) -> list[tuple[datetime | None, str | None]]:
+    # 同 parse_many，同时返回命中的规则名称
+    results = []
+    for name in names:
+        try:
+            results.append(match_filename(name))
+        except ValueError:
+            results.append((None, None))
+    return results
+
+
+# 批量模式只处理这些前缀开头的文件，命令行 --only-special 和网页共用
+SPECIAL_PREFIXES = ('mmexport', 'petal')
+
+VIDEO_EXTS = ('.mp4', '.mov', '.m4v', '.3gp', '.avi', '.mkv', '.wmv')
+
+
+def is_video(filepath: str) -> bool:
+    return os.path.splitext(filepath)[1].lower() in VIDEO_EXTS
+
+
+def exif_time_args(dt: datetime, video: bool) -> list[str]:
+    dt_str = dt.strftime('%Y:%m:%d %H:%M:%S')
+    # 文件系统时间带上 UTC 偏移，避免 exiftool 按运行环境的时区解释
+    offset = ZONE.offset_string(dt)
+    cmd = [
+        '-overwrite_original',
+        f'-AllDates={dt_str}',
+        f'-FileModifyDate={dt_str}{offset}',
+        f'-FileCreateDate={dt_str}{offset}',
+    ]
+    if ZONE.explicit and not video:
+        cmd.extend([
+            f'-OffsetTime={offset}',
+            f'-OffsetTimeOriginal={offset}',
+            f'-OffsetTimeDigitized={offset}',
+        ])
+    
+    # 针对视频文件增加更多时间标签
+    if video:
+        cmd.extend([
+            f'-CreateDate={dt_str}',
+            f'-ModifyDate={dt_str}',
+            f'-TrackCreateDate={dt_str}',
+            f'-TrackModifyDate={dt_str}',
+            f'-MediaCreateDate={dt_str}',
+            f'-MediaModifyDate={dt_str}',
+            f'-CreationDate={dt_str}',
+            f'-DateTimeOriginal={dt_str}',
+        ])
+    return cmd
+
+
+def failed_files(result, filepaths: list[str]) -> set[str] | None:
+    # 从 exiftool 输出中找出失败的文件，无法逐个对应时返回 None
+    if result.ok:
+        return set()
+    failed = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('Error'):
+            continue
+        for fp in filepaths:
+            if line.endswith(' - ' + fp):
+                failed.add(fp)
+                break
+    m = re.search(r'(\d+) (?:image )?files? weren\'t updated due to errors', result.stdout)
+    if m and int(m.group(1)) == len(failed):
+        return failed
+    if not m and len(failed) == len(filepaths):
+        return failed
+    return None
+
+
+# fix_exif_times 返回的单个文件状态
+FIXED = 'fixed'
+CORRECT = 'correct'  # 内嵌时间已正确，未调用 exiftool，只更新了文件修改时间
+FAILED = 'failed'
+
+
+# 写入后端：auto 优先原地改写已有的定长日期字段（JPEG/MP4/MOV），不支持时回退到 exiftool
+BACKENDS = ('auto', 'exiftool')
+
+
+def is_correct(filepath: str, dt: datetime) -> bool:
+    from metadata import date_mismatches
+    
+    try:
+        return date_mismatches(filepath, dt) == []
+    except (OSError, ValueError):
+        return False
+
+
+def patch_in_place(filepath: str, dt: datetime) -> bool:
+    from metadata import patch_file
+    
+    try:
+        return patch_file(filepath, dt)
+    except (OSError, ValueError):
+        return False
+
+
+def fix_exif_times(filepaths: list[str], dt: datetime, skip_correct: bool = True,
+                   backend: str = 'auto') -> dict[str, str]:
+    # 同一时间、同类标签的文件一次 exiftool 调用写完；内嵌时间已正确的文件不再重写
+    from metrics import METRICS
+    
+    ts = ZONE.to_epoch(dt)
+    dt = ZONE.aware(dt)
+    statuses = {}
+    if skip_correct:
+        for fp in filepaths:
+            with METRICS.stage('check_correct'):
+                correct = is_correct(fp, dt)
+            if correct:
+                with METRICS.stage('utime'):
+                    os.utime(fp, (ts, ts))
+                statuses[fp] = CORRECT
+    if backend == 'auto':
+        for fp in filepaths:
+            if fp in statuses:
+                continue
+            with METRICS.stage('native_patch'):
+                patched = patch_in_place(fp, dt)
+            if patched:
+                with METRICS.stage('utime'):
+                    os.utime(fp, (ts, ts))
+                statuses[fp] = FIXED
+    filepaths = [fp for fp in filepaths if fp not in statuses]
+    if not filepaths:
+        return statuses
+    from exiftool_pool import get_pool
+    
+    cmd = exif_time_args(dt, is_video(filepaths[0]))
+    result = get_pool().execute(cmd + filepaths)
+    failed = failed_files(result, filepaths)
+    if failed is None:
+        if len(filepaths) == 1:
+            failed = set(filepaths)
+        else:
+            # 输出无法对应到具体文件，逐个重试
+            for fp in filepaths:
+                statuses.update(fix_exif_times([fp], dt, skip_correct=False, backend='exiftool'))
+            return statuses
+    METRICS.inc('exiftool_files_total', len(filepaths))
+    METRICS.inc('exiftool_failed_files_total', len(failed))
+    
+    for fp in filepaths:
+        if fp not in failed:
+            with METRICS.stage('utime'):
+                os.utime(fp, (ts, ts))
+        statuses[fp] = FAILED if fp in failed else FIXED
+    return statuses
+
+
+def fix_exif_time(filepath: str, dt: datetime) -> bool:
+    return fix_exif_times([filepath], dt)[filepath] != FAILED
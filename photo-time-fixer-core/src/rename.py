@@ -0,0 +1,113 @@
+import errno
+import os
+from datetime import datetime
+from pathlib import Path
+
+from dedup import full_hash
+from tz import ZONE
+
+# 重命名规划：每个目录只列一次文件名建立内存索引，按处理顺序依次分配目标文件名，
+# 执行重命名时不再逐个 stat，改名本身不覆盖已有文件。同一秒的多个文件依次追加 _1、_2 后缀，与已占用文件内容完全相同的视为重复
+
+
+def rename_target(f: Path, dt: datetime) -> str:
+    return dt.strftime('%Y%m%d%H%M%S') + '_' + str(int(ZONE.to_epoch(dt))) + f.suffix
+
+
+def _rename_noreplace(src: Path, dst: Path):
+    # 先硬链接到新名字再删除旧名字，目标已存在时 os.link 抛出 FileExistsError，不会覆盖
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        raise
+    except OSError:
+        # 不支持硬链接的文件系统（FAT、部分 SMB 挂载）退回到改名前检查
+        if os.path.lexists(dst):
+            raise FileExistsError(errno.EEXIST, '目标文件已存在', str(dst)) from None
+        os.rename(src, dst)
+        return
+    os.unlink(src)
+
+
+def rename_file(f: Path, new_path: Path, dt: datetime) -> Path:
+    # 按规划的目标改名；规划后目标被其他文件占用时（目录索引已过期）依次尝试下一个后缀，返回实际路径
+    stem, ext = os.path.splitext(rename_target(f, dt))
+    candidate = new_path
+    n = 0
+    while True:
+        try:
+            _rename_noreplace(f, candidate)
+            return candidate
+        except FileExistsError:
+            n += 1
+            candidate = f.parent / f'{stem}_{n}{ext}'
+
+
+class RenamePlanner:
+    def __init__(self):
+        # 目录 -> {小写文件名: 实际文件名}；按小写比较，兼容 SMB 等不区分大小写的文件系统
+        self._names = {}
+        self._hashes = {}
+        # 本次运行已分配的目标路径 -> 原文件路径，比较内容时原文件可能已被改名
+        self._sources = {}
+
+    def _index(self, directory: Path) -> dict[str, str]:
+        names = self._names.get(directory)
+        if names is None:
+            with os.scandir(directory) as it:
+                names = self._names[directory] = {entry.name.lower(): entry.name for entry in it}
+        return names
+
+    def _hash(self, path: Path, st: os.stat_result) -> str:
+        # 监听模式下同一路径可能换成新文件，缓存键带上大小和修改时间
+        key = (path, st.st_size, st.st_mtime_ns)
+        if (digest := self._hashes.get(key)) is None:
+            digest = self._hashes[key] = full_hash(path)
+        return digest
+
+    def _same_content(self, a: Path, b: Path) -> bool:
+        try:
+            sa, sb = a.stat(), b.stat()
+            return sa.st_size == sb.st_size and self._hash(a, sa) == self._hash(b, sb)
+        except OSError:
+            return False
+
+    def release(self, new_path: Path):
+        # 监听模式下该文件所在批次处理完后调用，之后的比较直接读取新路径
+        self._sources.pop(new_path, None)
+
+    def clear_hashes(self):
+        # 监听模式下队列清空时调用，长时间运行时哈希缓存不会持续增长
+        self._hashes.clear()
+
+    def add(self, f: Path):
+        # 监听模式下文件一出现就加入已建立的索引，仍在写入的文件名也不会被分配给其他文件
+        names = self._names.get(f.parent)
+        if names is not None:
+            names[f.name.lower()] = f.name
+
+    def plan(self, f: Path, dt: datetime, in_use=None) -> tuple[Path | None, Path | None]:
+        # 返回 (新路径, 内容相同的已有文件)；文件名已符合格式时两者都为 None
+        # in_use(path) 为真的文件仍在写入或处理中，不读取其内容，直接视为不同文件
+        names = self._index(f.parent)
+        target = rename_target(f, dt)
+        stem, ext = os.path.splitext(target)
+        candidate = target
+        n = 0
+        while (occupant := names.get(candidate.lower())) is not None:
+            if occupant == f.name:
+                return None, None
+            other = f.parent / occupant
+            source = self._sources.get(other)
+            if source is None and not other.exists():
+                # 索引建立后文件已被移走（监听模式下常见），名字可以复用
+                break
+            busy = in_use is not None and (in_use(other) or source is not None and in_use(source))
+            if not busy and self._same_content(f, source if source is not None and source.exists() else other):
+                return None, other
+            n += 1
+            candidate = f'{stem}_{n}{ext}'
+        names[candidate.lower()] = candidate
+        new_path = f.parent / candidate
+        self._sources[new_path] = f
+        return new_path, None
@@ -0,0 +1,47 @@
+import fnmatch
+import os
+import re
+from typing import Iterator
+
+# 目录遍历：基于 os.scandir 的生成器，复用 DirEntry 缓存的类型信息，边遍历边产出文件
+
+
+def _glob_regex(patterns) -> re.Pattern | None:
+    if not patterns:
+        return None
+    return re.compile('|'.join(fnmatch.translate(p.lower()) for p in patterns))
+
+
+class FileFilter:
+    # include/exclude 为通配符（匹配文件名，不区分大小写），exts 为扩展名列表
+    def __init__(self, include=(), exclude=(), exts=()):
+        self._include = _glob_regex(include)
+        self._exclude = _glob_regex(exclude)
+        self._exts = tuple('.' + e.lower().lstrip('.') for e in exts)
+
+    def accepts(self, name: str) -> bool:
+        lower = name.lower()
+        if self._exts and not lower.endswith(self._exts):
+            return False
+        if self._include is not None and not self._include.match(lower):
+            return False
+        return not self.excludes(lower)
+
+    def excludes(self, name: str) -> bool:
+        return self._exclude is not None and self._exclude.match(name.lower()) is not None
+
+
+def scan_files(root, file_filter: FileFilter | None = None, recursive: bool = False) -> Iterator[os.DirEntry]:
+    # 同一目录内按文件名排序，先产出文件再进入子目录
+    with os.scandir(root) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    subdirs = []
+    for entry in entries:
+        if entry.is_file():
+            if file_filter is None or file_filter.accepts(entry.name):
+                yield entry
+        elif recursive and entry.is_dir(follow_symlinks=False):
+            if file_filter is None or not file_filter.excludes(entry.name):
+                subdirs.append(entry.path)
+    for path in subdirs:
+        yield from scan_files(path, file_filter, recursive)
@@ -1,17 +1,42 @@
 #!/usr/bin/env python3
+import base64
+import calendar
+import json
+import mmap
 import os
-import re
-import subprocess
+import shutil
 import tempfile
+import time
 import zipfile
-from datetime import datetime
-from io import BytesIO
+from functools import lru_cache
 from pathlib import Path
 
-from flask import Flask, request, send_file, render_template_string
+from flask import Flask, Response, abort, request, render_template_string, send_file
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+from jobs import JobManager
+from metadata import date_patches
+from metrics import METRICS
+from photo_time import SPECIAL_PREFIXES, fix_exif_times, load_patterns, parse_many
+from rename import rename_target
+from tz import ZONE
 
 app = Flask(__name__)
 
+# 服务端常驻运行，指标始终开启，由 /metrics 导出
+METRICS.enabled = True
+
+# 时间戳文件名换算本地时间所用的时区（如 Asia/Shanghai 或 +08:00），不设置时使用本机时区
+ZONE.configure(os.environ.get('PHOTO_TZ'))
+
+# 自定义文件名规则文件（JSON），格式同命令行 --patterns
+if os.environ.get('PHOTO_PATTERNS'):
+    load_patterns(os.environ['PHOTO_PATTERNS'])
+
+# 页面并发上传的请求数和初始批大小（字节），批大小随后按实测吞吐量自适应
+UPLOAD_CONCURRENCY = max(1, int(os.environ.get('UPLOAD_CONCURRENCY', 4)))
+UPLOAD_BATCH_BYTES = 8 * 1024 * 1024
+
 HTML = '''
 <!DOCTYPE html>
 <html>
@@ -159,8 +184,13 @@ HTML = '''
             <span class="stat-error" id="statErr"></span>
         </div>
         <div class="filter-options" id="filterOptions">
-            <label title="开启后，即使选择了整个文件夹，也只处理 mmexport 或 petal 开头的文件">
-                <input type="checkbox" id="onlySpecialFiles" checked> 批量模式：仅处理 mmexport/petal 开头的文件
+            <label title="开启后，即使选择了整个文件夹，也只处理 {{ special_prefixes|join(' 或 ') }} 开头的文件">
+                <input type="checkbox" id="onlySpecialFiles" checked> 批量模式：仅处理 {{ special_prefixes|join('/') }} 开头的文件
+            </label>
+        </div>
+        <div class="filter-options">
+            <label title="JPEG/MP4/MOV 只上传元数据片段，由浏览器把修正后的时间写回原文件，其余文件仍完整上传">
+                <input type="checkbox" id="metadataOnly" checked> 仅传输元数据（JPEG/MP4/MOV）
             </label>
         </div>
         <button class="btn btn-primary" id="submitBtn" disabled>处理并下载</button>
@@ -176,8 +206,18 @@ HTML = '''
         const stats = document.getElementById('stats');
         const filterOptions = document.getElementById('filterOptions');
         const onlySpecialFiles = document.getElementById('onlySpecialFiles');
+        const metadataOnly = document.getElementById('metadataOnly');
         let files = [];
         let sortedTimes = [];
+        // 已解析过的文件不再重复请求，新增文件分块并发解析
+        const PARSE_CHUNK = 5000;
+
+        // 与命令行 --only-special 共用同一组前缀
+        const SPECIAL_PREFIXES = {{ special_prefixes|tojson }};
+        const isSpecial = name => {
+            const nameLower = name.toLowerCase();
+            return SPECIAL_PREFIXES.some(p => nameLower.startsWith(p));
+        };
 
         const folderInput = document.getElementById('folderInput');
         let pressTimer;
@@ -196,22 +236,40 @@ HTML = '''
         folderInput.onchange = () => handleFiles(folderInput.files);
         onlySpecialFiles.onchange = () => renderFileList();
 
+        // 服务端返回按本地墙钟时间计的秒数，用 UTC 取值即可还原原始的年月日时分秒
+        const pad = n => String(n).padStart(2, '0');
+        function formatTime(epoch) {
+            const d = new Date(epoch * 1000);
+            return `${d.getUTCFullYear()}-${pad(d.getUTCMonth() + 1)}-${pad(d.getUTCDate())} ` +
+                `${pad(d.getUTCHours())}:${pad(d.getUTCMinutes())}:${pad(d.getUTCSeconds())}`;
+        }
+
+        async function parseNames(names) {
+            const chunks = [];
+            for (let i = 0; i < names.length; i += PARSE_CHUNK) chunks.push(names.slice(i, i + PARSE_CHUNK));
+            const results = await Promise.all(chunks.map(async chunk => {
+                const resp = await fetch('/parse', {
+                    method: 'POST',
+                    headers: {'Content-Type': 'application/json'},
+                    body: JSON.stringify({names: chunk, format: 'epoch'})
+                });
+                return resp.ok ? (await resp.json()).epoch : chunk.map(() => null);
+            }));
+            return results.flat();
+        }
+
         async function handleFiles(newFiles) {
-            files = [...files, ...Array.from(newFiles)];
-            const resp = await fetch('/parse', {
-                method: 'POST',
-                headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({names: files.map(f => f.name)})
-            });
-            const parsed = await resp.json();
+            const added = Array.from(newFiles);
+            const parsed = await parseNames(added.map(f => f.name));
             
             // 按解析时间排序（新的在前）
-            const items = files.map((f, i) => ({file: f, time: parsed[i], idx: i}));
+            const items = files.map((f, i) => ({file: f, time: sortedTimes[i]}));
+            added.forEach((f, i) => items.push({file: f, time: parsed[i]}));
             items.sort((a, b) => {
-                if (!a.time && !b.time) return 0;
-                if (!a.time) return 1;
-                if (!b.time) return -1;
-                return new Date(b.time) - new Date(a.time);
+                if (a.time === null && b.time === null) return 0;
+                if (a.time === null) return 1;
+                if (b.time === null) return -1;
+                return b.time - a.time;
             });
             files = items.map(it => it.file);
             sortedTimes = items.map(it => it.time);
@@ -220,26 +278,33 @@ HTML = '''
 
         function renderFileList() {
             let ok = 0, err = 0;
-            fileList.innerHTML = '';
             const filterActive = onlySpecialFiles.checked;
+            // 先在 DocumentFragment 中构建，最后一次性挂载，避免上万次重排
+            const fragment = document.createDocumentFragment();
             
             files.forEach((f, i) => {
-                const nameLower = f.name.toLowerCase();
-                const isMatch = nameLower.startsWith('mmexport') || nameLower.startsWith('petal');
-                if (filterActive && !isMatch) return;
+                if (filterActive && !isSpecial(f.name)) return;
 
                 const div = document.createElement('div');
                 div.className = 'file-item';
+                const name = document.createElement('span');
+                name.className = 'file-name';
+                name.textContent = f.name;
+                const info = document.createElement('span');
                 const time = sortedTimes[i];
-                if (time) {
-                    div.innerHTML = `<span class="file-name">${f.name}</span><span class="file-time">${time}</span>`;
+                if (time !== null) {
+                    info.className = 'file-time';
+                    info.textContent = formatTime(time);
                     ok++;
                 } else {
-                    div.innerHTML = `<span class="file-name">${f.name}</span><span class="file-error">无法解析</span>`;
+                    info.className = 'file-error';
+                    info.textContent = '无法解析';
                     err++;
                 }
-                fileList.appendChild(div);
+                div.append(name, info);
+                fragment.appendChild(div);
             });
+            fileList.replaceChildren(fragment);
 
             fileList.style.display = files.length > 0 ? 'block' : 'none';
             stats.style.display = files.length > 0 ? 'flex' : 'none';
@@ -248,6 +313,264 @@ HTML = '''
             submitBtn.disabled = ok === 0;
         }
 
+        // 仅元数据模式：JPEG 上传开头 128KB，MP4/MOV 上传 moov 原子
+        const META_BATCH_SIZE = 50;
+        const JPEG_HEADER_SIZE = 131072;
+        const ZIP_LIMIT = 0xFFFFFFFF;
+
+        function extOf(name) {
+            const i = name.lastIndexOf('.');
+            return i > 0 ? name.slice(i).toLowerCase() : '';
+        }
+
+        async function readHeader(file) {
+            const ext = extOf(file.name);
+            if (ext === '.jpg' || ext === '.jpeg') {
+                return {offset: 0, blob: file.slice(0, JPEG_HEADER_SIZE)};
+            }
+            if (!['.mp4', '.mov', '.m4v', '.3gp'].includes(ext)) return null;
+            let pos = 0;
+            while (pos + 8 <= file.size) {
+                const view = new DataView(await file.slice(pos, pos + 16).arrayBuffer());
+                let size = view.getUint32(0);
+                const type = String.fromCharCode(view.getUint8(4), view.getUint8(5), view.getUint8(6), view.getUint8(7));
+                if (size === 1 && view.byteLength >= 16) size = Number(view.getBigUint64(8));
+                else if (size === 0) size = file.size - pos;
+                if (size < 8) return null;
+                if (type === 'moov') return {offset: pos, blob: file.slice(pos, pos + size)};
+                pos += size;
+            }
+            return null;
+        }
+
+        function applyPatches(file, patches) {
+            const parts = [];
+            let pos = 0;
+            patches.sort((a, b) => a[0] - b[0]);
+            for (const [offset, data] of patches) {
+                const bytes = Uint8Array.from(atob(data), c => c.charCodeAt(0));
+                parts.push(file.slice(pos, offset), bytes);
+                pos = offset + bytes.length;
+            }
+            parts.push(file.slice(pos));
+            return new Blob(parts);
+        }
+
+        const CRC_TABLE = (() => {
+            const table = new Uint32Array(256);
+            for (let n = 0; n < 256; n++) {
+                let c = n;
+                for (let k = 0; k < 8; k++) c = c & 1 ? 0xEDB88320 ^ (c >>> 1) : c >>> 1;
+                table[n] = c >>> 0;
+            }
+            return table;
+        })();
+
+        async function crc32(blob) {
+            let crc = 0xFFFFFFFF;
+            for (let pos = 0; pos < blob.size; pos += 4194304) {
+                const buf = new Uint8Array(await blob.slice(pos, pos + 4194304).arrayBuffer());
+                for (let i = 0; i < buf.length; i++) crc = CRC_TABLE[(crc ^ buf[i]) & 0xFF] ^ (crc >>> 8);
+            }
+            return (crc ^ 0xFFFFFFFF) >>> 0;
+        }
+
+        // 在浏览器中生成不压缩（stored）的 ZIP
+        async function buildZip(entries) {
+            const parts = [];
+            const central = [];
+            let offset = 0;
+            let centralSize = 0;
+            for (const e of entries) {
+                const name = new TextEncoder().encode(e.name);
+                const crc = await crc32(e.blob);
+                // mtime 已加上时区偏移，按 UTC 读取即为墙钟时间
+                const d = new Date(e.mtime * 1000);
+                const time = (d.getUTCHours() << 11) | (d.getUTCMinutes() << 5) | (d.getUTCSeconds() >> 1);
+                const date = ((d.getUTCFullYear() - 1980) << 9) | ((d.getUTCMonth() + 1) << 5) | d.getUTCDate();
+                const local = new DataView(new ArrayBuffer(30));
+                local.setUint32(0, 0x04034b50, true);
+                local.setUint16(4, 20, true);
+                local.setUint16(6, 0x0800, true);
+                local.setUint16(10, time, true);
+                local.setUint16(12, date, true);
+                local.setUint32(14, crc, true);
+                local.setUint32(18, e.blob.size, true);
+                local.setUint32(22, e.blob.size, true);
+                local.setUint16(26, name.length, true);
+                parts.push(local, name, e.blob);
+                const entry = new DataView(new ArrayBuffer(46));
+                entry.setUint32(0, 0x02014b50, true);
+                entry.setUint16(4, 20, true);
+                entry.setUint16(6, 20, true);
+                entry.setUint16(8, 0x0800, true);
+                entry.setUint16(12, time, true);
+                entry.setUint16(14, date, true);
+                entry.setUint32(16, crc, true);
+                entry.setUint32(20, e.blob.size, true);
+                entry.setUint32(24, e.blob.size, true);
+                entry.setUint16(28, name.length, true);
+                entry.setUint32(42, offset, true);
+                central.push(entry, name);
+                offset += 30 + name.length + e.blob.size;
+                centralSize += 46 + name.length;
+            }
+            const end = new DataView(new ArrayBuffer(22));
+            end.setUint32(0, 0x06054b50, true);
+            end.setUint16(8, entries.length, true);
+            end.setUint16(10, entries.length, true);
+            end.setUint32(12, centralSize, true);
+            end.setUint32(16, offset, true);
+            return new Blob([...parts, ...central, end], {type: 'application/zip'});
+        }
+
+        // 返回 {blobs: 本地生成的压缩包, rest: 需要完整上传的文件}
+        async function processMetadata(targetFiles, progressBar) {
+            const entries = [];
+            const rest = [];
+            for (let i = 0; i < targetFiles.length; i += META_BATCH_SIZE) {
+                const batch = targetFiles.slice(i, i + META_BATCH_SIZE);
+                status.textContent = `读取元数据 ${Math.min(i + META_BATCH_SIZE, targetFiles.length)}/${targetFiles.length}`;
+                const formData = new FormData();
+                const sent = [];
+                for (const f of batch) {
+                    // 本地生成的 ZIP 不支持 ZIP64，单个文件达到 4GB 时大小和偏移写不下，改为完整上传
+                    if (f.size + 30 + f.name.length * 3 >= ZIP_LIMIT) {
+                        rest.push(f);
+                        continue;
+                    }
+                    const header = await readHeader(f);
+                    if (!header) {
+                        rest.push(f);
+                        continue;
+                    }
+                    formData.append('names', f.name);
+                    formData.append('offsets', header.offset);
+                    formData.append('headers', header.blob, f.name);
+                    sent.push(f);
+                }
+                if (sent.length > 0) {
+                    const resp = await fetch('/patch', { method: 'POST', body: formData });
+                    const results = resp.ok ? await resp.json() : sent.map(() => null);
+                    sent.forEach((f, j) => {
+                        const r = results[j];
+                        if (r) entries.push({name: r.name, mtime: r.mtime + r.offset, blob: applyPatches(f, r.patches)});
+                        else rest.push(f);
+                    });
+                }
+                progressBar.style.width = `${(Math.min(i + META_BATCH_SIZE, targetFiles.length) / targetFiles.length) * 50}%`;
+            }
+
+            // 单个压缩包不超过 4GB
+            const blobs = [];
+            let group = [];
+            let groupSize = 0;
+            for (const e of entries) {
+                const size = e.blob.size + 30 + e.name.length * 3;
+                if (group.length > 0 && (groupSize + size > ZIP_LIMIT || group.length >= 65535)) {
+                    blobs.push(await buildZip(group));
+                    group = [];
+                    groupSize = 0;
+                }
+                group.push(e);
+                groupSize += size;
+            }
+            if (group.length > 0) blobs.push(await buildZip(group));
+            return {blobs, rest};
+        }
+
+        // 后台任务：通过 SSE（失败时轮询）等待任务完成
+        function waitJob(id, onProgress) {
+            return new Promise(resolve => {
+                const poll = async () => {
+                    const resp = await fetch(`/jobs/${id}`);
+                    if (!resp.ok) return resolve(null);
+                    const state = await resp.json();
+                    onProgress(state);
+                    if (state.status === 'done') resolve(state);
+                    else setTimeout(poll, 1000);
+                };
+                const source = new EventSource(`/jobs/${id}/events`);
+                source.onmessage = e => {
+                    const state = JSON.parse(e.data);
+                    onProgress(state);
+                    if (state.status === 'done') {
+                        source.close();
+                        resolve(state);
+                    }
+                };
+                source.onerror = () => {
+                    source.close();
+                    poll();
+                };
+            });
+        }
+
+        // 并发上传：多个请求同时向同一个上传会话追加文件，批大小按字节自适应，
+        // 让每批上传耗时接近 BATCH_SECONDS，链路不会在批与批之间空闲
+        const UPLOAD_CONCURRENCY = {{ upload_concurrency }};
+        const BATCH_SECONDS = 2;
+        const MIN_BATCH_BYTES = 1048576;
+        const MAX_BATCH_BYTES = 67108864;
+
+        // 返回上传失败的文件（重试后仍失败，或会话已关闭）
+        async function uploadAll(id, targetFiles, onSent) {
+            const queue = [...targetFiles];
+            const failed = [];
+            let batchBytes = {{ upload_batch_bytes }};
+            let sent = 0;
+            const nextBatch = () => {
+                const batch = [];
+                let size = 0;
+                while (queue.length > 0 && (batch.length === 0 || size + queue[0].size <= batchBytes)) {
+                    const f = queue.shift();
+                    batch.push(f);
+                    size += f.size;
+                }
+                return {batch, size};
+            };
+            const worker = async () => {
+                for (let {batch, size} = nextBatch(); batch.length > 0; ({batch, size} = nextBatch())) {
+                    const formData = new FormData();
+                    batch.forEach(f => formData.append('files', f));
+                    const start = performance.now();
+                    let resp = null;
+                    // 网络错误和服务端错误重试一次，409（会话已关闭）不重试
+                    for (let attempt = 0; attempt < 2 && !(resp && (resp.ok || resp.status === 409)); attempt++) {
+                        resp = await fetch(`/jobs/${id}/files`, { method: 'POST', body: formData }).catch(() => null);
+                    }
+                    if (!resp || !resp.ok) failed.push(...batch);
+                    // 按单个请求的实际吞吐量估算下一批的字节数
+                    const seconds = Math.max((performance.now() - start) / 1000, 0.05);
+                    batchBytes = Math.min(MAX_BATCH_BYTES, Math.max(MIN_BATCH_BYTES, size / seconds * BATCH_SECONDS));
+                    sent += size;
+                    onSent(sent);
+                }
+            };
+            await Promise.all(Array.from({length: UPLOAD_CONCURRENCY}, worker));
+            return failed;
+        }
+
+        // 返回 {jobId, failed}：全部文件处理完成后只需下载一次，failed 为未能上传的文件
+        async function runSession(targetFiles, onProgress) {
+            const resp = await fetch('/jobs?open=1', { method: 'POST' }).catch(() => null);
+            if (!resp || !resp.ok) return {jobId: null, failed: targetFiles};
+            const job = await resp.json();
+            const finished = waitJob(job.id, state => onProgress({processed: state.done}));
+            const failed = await uploadAll(job.id, targetFiles, sent => onProgress({sent}));
+            await fetch(`/jobs/${job.id}/close`, { method: 'POST' });
+            // 会话中途失效时所有文件都算作失败
+            const jobId = await finished ? job.id : null;
+            return {jobId, failed: jobId ? failed : targetFiles};
+        }
+
+        function download(href, name) {
+            const a = document.createElement('a');
+            a.href = href;
+            a.download = name;
+            a.click();
+        }
+
         submitBtn.onclick = async () => {
             submitBtn.disabled = true;
             const progress = document.getElementById('progress');
@@ -255,51 +578,50 @@ HTML = '''
             progress.style.display = 'block';
             
             const filterActive = onlySpecialFiles.checked;
-            const targetFiles = files.filter(f => {
-                if (!filterActive) return true;
-                const nameLower = f.name.toLowerCase();
-                return nameLower.startsWith('mmexport') || nameLower.startsWith('petal');
+            let targetFiles = files.filter(f => {
+                return !filterActive || isSpecial(f.name);
             });
             
-            const BATCH_SIZE = 20;
-            const allBlobs = [];
-            for (let i = 0; i < targetFiles.length; i += BATCH_SIZE) {
-                const batch = targetFiles.slice(i, i + BATCH_SIZE);
-                status.textContent = `上传中 ${Math.min(i + BATCH_SIZE, targetFiles.length)}/${targetFiles.length}`;
-                progressBar.style.width = `${(i / targetFiles.length) * 50}%`;
-                
-                const formData = new FormData();
-                batch.forEach(f => formData.append('files', f));
-                
-                const resp = await fetch('/process', { method: 'POST', body: formData });
-                if (resp.ok) {
-                    allBlobs.push(await resp.blob());
-                }
-                progressBar.style.width = `${((i + BATCH_SIZE) / targetFiles.length) * 50 + 50}%`;
+            const downloads = [];
+            let failed = [];
+            let base = 0;
+            if (metadataOnly.checked) {
+                const {blobs, rest} = await processMetadata(targetFiles, progressBar);
+                downloads.push(...blobs.map(blob => URL.createObjectURL(blob)));
+                targetFiles = rest;
+                base = 50;
+            }
+            if (targetFiles.length > 0) {
+                const totalBytes = targetFiles.reduce((n, f) => n + f.size, 0) || 1;
+                let sent = 0;
+                let processed = 0;
+                let jobId;
+                ({jobId, failed} = await runSession(targetFiles, p => {
+                    sent = p.sent ?? sent;
+                    processed = p.processed ?? processed;
+                    status.textContent = `上传 ${Math.round(sent / totalBytes * 100)}%，已处理 ${processed}/${targetFiles.length}`;
+                    progressBar.style.width = `${base + (sent / totalBytes + processed / targetFiles.length) * (100 - base) / 2}%`;
+                }));
+                // 服务端结果直接由浏览器流式下载，不经过内存中的 Blob
+                if (jobId) downloads.push(`/jobs/${jobId}/download`);
             }
-            // ... (剩余下载代码保持不变)
             
             status.textContent = '打包中...';
             progressBar.style.width = '100%';
             
-            if (allBlobs.length === 1) {
-                const url = URL.createObjectURL(allBlobs[0]);
-                const a = document.createElement('a');
-                a.href = url;
-                a.download = 'photos_fixed.zip';
-                a.click();
-            } else {
-                for (let i = 0; i < allBlobs.length; i++) {
-                    const url = URL.createObjectURL(allBlobs[i]);
-                    const a = document.createElement('a');
-                    a.href = url;
-                    a.download = `photos_fixed_${i + 1}.zip`;
-                    a.click();
-                    await new Promise(r => setTimeout(r, 500));
-                }
+            for (let i = 0; i < downloads.length; i++) {
+                if (i > 0) await new Promise(r => setTimeout(r, 500));
+                download(downloads[i], downloads.length === 1 ? 'photos_fixed.zip' : `photos_fixed_${i + 1}.zip`);
             }
             
-            status.textContent = `下载完成，共 ${allBlobs.length} 个压缩包`;
+            if (failed.length > 0) {
+                // 压缩包中缺少这些文件，列出文件名供重新上传
+                const names = failed.slice(0, 10).map(f => f.name).join('、');
+                const more = failed.length > 10 ? ' 等' : '';
+                status.textContent = `${failed.length} 个文件上传失败，压缩包中不包含：${names}${more}（共 ${downloads.length} 个压缩包）`;
+            } else {
+                status.textContent = `下载完成，共 ${downloads.length} 个压缩包`;
+            }
             submitBtn.disabled = false;
         };
     </script>
@@ -308,142 +630,358 @@ HTML = '''
 '''
 
 
-def parse_time_from_filename(filename: str) -> datetime | None:
-    name = Path(filename).stem
-    
-    if m := re.match(r'mmexport(\d{13})', name):
-        ts = int(m.group(1)) / 1000
-        return datetime.fromtimestamp(ts)
-    
-    if m := re.match(r'mmexport_(\d{13})', name):
-        ts = int(m.group(1)) / 1000
-        return datetime.fromtimestamp(ts)
-    
-    if m := re.search(r'_(\d{14})$', name):
-        return datetime.strptime(m.group(1), '%Y%m%d%H%M%S')
-    
-    if m := re.match(r'petal_(\d{8})_(\d{6})', name):
-        return datetime.strptime(m.group(1) + m.group(2), '%Y%m%d%H%M%S')
-    
-    if m := re.match(r'TG-(\d{4})-(\d{2})-(\d{2})-(\d{6})', name):
-        dt_str = m.group(1) + m.group(2) + m.group(3) + m.group(4)
-        return datetime.strptime(dt_str, '%Y%m%d%H%M%S')
-    
-    if m := re.match(r'微信图片_(\d{14})', name):
-        return datetime.strptime(m.group(1), '%Y%m%d%H%M%S')
-    
-    # VID_YYYYMMDD_HHMMSS
-    if m := re.match(r'VID_(\d{8})_(\d{6})', name):
-        return datetime.strptime(m.group(1) + m.group(2), '%Y%m%d%H%M%S')
+@app.route('/')
+def index():
+    return render_template_string(HTML, special_prefixes=SPECIAL_PREFIXES,
+                                  upload_concurrency=UPLOAD_CONCURRENCY, upload_batch_bytes=UPLOAD_BATCH_BYTES)
+
+
+# 页面每次只提交新增的文件名，同名文件的解析结果按 LRU 缓存
+PARSE_CACHE_SIZE = 65536
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_epoch(name: str) -> int | None:
+    # 返回本地墙钟时间按 UTC 换算的秒数，与服务端和浏览器时区无关
+    dt = parse_many([name])[0]
+    return calendar.timegm(dt.timetuple()) if dt else None
+
+
+@app.route('/parse', methods=['POST'])
+def parse():
+    # format=epoch 时返回列式的 {"epoch": [秒数或 null]}，否则返回格式化的时间字符串列表
+    names = request.json.get('names', [])
+    epochs = [parse_epoch(name) for name in names]
+    if request.json.get('format') == 'epoch':
+        return {'epoch': epochs}
+    return [time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(t)) if t is not None else None for t in epochs]
+
+
+# 已压缩格式直接存储，不再浪费 CPU 做 DEFLATE
+STORED_EXTS = {'.jpg', '.jpeg', '.heic', '.heif', '.png', '.gif', '.webp',
+               '.mp4', '.mov', '.m4v', '.3gp', '.avi', '.mkv', '.wmv'}
+CHUNK_SIZE = 1024 * 1024
+# 超过此大小的文件打包时通过 mmap 读取，CRC 直接在映射上计算，不再经过 read() 缓冲
+LARGE_FILE_BYTES = 64 * 1024 * 1024
+
+
+class ZipStream:
+    # 不可 seek 的写入缓冲，zipfile 写入的数据由生成器分块取走
+    def __init__(self):
+        self._chunks = []
     
-    # 通用：YYYYMMDD_HHMMSS 或 YYYYMMDDHHMMSS
-    if m := re.search(r'(20\d{2})(0[1-9]|1[0-2])(0[1-9]|[12]\d|3[01])[_-]?(\d{6})', name):
-        dt_str = m.group(1) + m.group(2) + m.group(3) + m.group(4)
-        return datetime.strptime(dt_str, '%Y%m%d%H%M%S')
+    def write(self, data) -> int:
+        # mmap 切片在 drain 时才复制成 bytes，其余数据原样保留
+        self._chunks.append(data if isinstance(data, memoryview) else bytes(data))
+        return len(data)
     
-    # 通用：YYYY-MM-DD 或 YYYY_MM_DD
-    if m := re.search(r'(20\d{2})[-_](0[1-9]|1[0-2])[-_](0[1-9]|[12]\d|3[01])', name):
-        return datetime(int(m.group(1)), int(m.group(2)), int(m.group(3)), 12, 0, 0)
+    def flush(self):
+        pass
     
-    # Notepad_YYYYMMDDHHMM_xxx 或 vp_output_YYYYMMDDHHMM
-    if m := re.search(r'_(20\d{2})(0[1-9]|1[0-2])(0[1-9]|[12]\d|3[01])([01]\d|2[0-3])([0-5]\d)', name):
-        return datetime(int(m.group(1)), int(m.group(2)), int(m.group(3)), int(m.group(4)), int(m.group(5)), 0)
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(entries):
+    # entries 逐个产出 (文件路径, 压缩包内文件名)，每写完一块就输出，内存占用与文件大小无关
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, 'w') as zf:
+        for filepath, name in entries:
+            zinfo = zipfile.ZipInfo.from_file(filepath, name)
+            # 按配置的时区记录修改时间，与服务端所在时区无关
+            zinfo.date_time = ZONE.from_epoch(int(os.path.getmtime(filepath))).timetuple()[:6]
+            if Path(name).suffix.lower() in STORED_EXTS:
+                zinfo.compress_type = zipfile.ZIP_STORED
+            else:
+                zinfo.compress_type = zipfile.ZIP_DEFLATED
+            with zf.open(zinfo, 'w') as dst:
+                for chunk in file_chunks(filepath, zinfo.file_size):
+                    dst.write(chunk)
+                    if data := stream.drain():
+                        yield data
+            if data := stream.drain():
+                yield data
+    yield stream.drain()
+
+
+def file_chunks(filepath: str, size: int):
+    # 大文件映射到内存后按块切片，无法映射（空文件、不支持 mmap 的文件系统）时按块读取
+    if size >= LARGE_FILE_BYTES:
+        try:
+            with open(filepath, 'rb') as f:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            buf = None
+        if buf is not None:
+            if hasattr(buf, 'madvise'):
+                buf.madvise(mmap.MADV_SEQUENTIAL)
+            view = memoryview(buf)
+            for pos in range(0, len(view), CHUNK_SIZE):
+                yield view[pos:pos + CHUNK_SIZE]
+            return
+    with open(filepath, 'rb') as src:
+        while chunk := src.read(CHUNK_SIZE):
+            yield chunk
+
+
+def output_name(filename: str, dt) -> str:
+    # 与命令行 --rename 的文件名格式相同
+    return rename_target(Path(filename), dt)
+
+
+def process_one(item) -> tuple[str, str]:
+    # item 为 (文件路径, 原文件名, 解析时间)，返回 (处理后的路径, 压缩包内文件名)
+    filepath, filename, dt = item
+    start = time.perf_counter()
+    status = fix_exif_times([filepath], dt)[filepath]
     
-    # 通用：13位毫秒时间戳（优先匹配最后一个）
-    matches = list(re.finditer(r'(\d{13})', name))
-    if matches:
-        for m in reversed(matches):
-            ts = int(m.group(1)) / 1000
-            if 1000000000 < ts < 2000000000:
-                return datetime.fromtimestamp(ts)
+    ts = ZONE.to_epoch(dt)
+    with METRICS.stage('utime'):
+        os.utime(filepath, (ts, ts))
     
-    # 通用：10位秒时间戳
-    if m := re.search(r'(\d{10})', name):
-        ts = int(m.group(1))
-        if 1000000000 < ts < 2000000000:
-            return datetime.fromtimestamp(ts)
+    # 临时文件名唯一，结果文件名只用于压缩包内和下载，同一时间的多个文件不会互相覆盖
+    new_name = output_name(filename, dt)
     
-    # video_YYMMDD_HHMMSS
-    if m := re.match(r'video_(\d{2})(\d{2})(\d{2})_(\d{2})(\d{2})(\d{2})', name):
-        year = 2000 + int(m.group(1))
-        return datetime(year, int(m.group(2)), int(m.group(3)), int(m.group(4)), int(m.group(5)), int(m.group(6)))
+    METRICS.inc('files_total', status=status)
+    METRICS.inc('bytes_processed_total', os.path.getsize(filepath))
+    METRICS.observe('file_seconds', time.perf_counter() - start)
+    return filepath, new_name
+
+
+def unique_names(entries):
+    # 同一时间的多个文件、同一会话的多批上传可能得到相同的结果文件名，压缩包内追加序号区分
+    seen = set()
+    for filepath, name in entries:
+        stem, ext = os.path.splitext(name)
+        unique = name
+        n = 1
+        while unique in seen:
+            unique = f'{stem}_{n}{ext}'
+            n += 1
+        seen.add(unique)
+        yield filepath, unique
+
+
+def process_saved(saved):
+    # 处理完一个就交给 stream_zip
+    for item in saved:
+        yield process_one(item)
+
+
+def receive_uploads(tmpdir: str) -> list:
+    # 流式解析 multipart 请求体：先读文件名，解析不出时间的文件直接丢弃其内容，
+    # 其余文件按块直接写入临时目录，不经过 Werkzeug 的整体缓存和 f.save 二次拷贝
+    # 返回 [(文件路径, 原文件名, 解析时间)]
+    boundary = request.mimetype_params.get('boundary')
+    if request.mimetype != 'multipart/form-data' or not boundary:
+        return []
     
-    return None
+    decoder = MultipartDecoder(boundary.encode('latin-1'))
+    saved = []
+    out = None
+    eof = False
+    start = time.perf_counter()
+    try:
+        while True:
+            event = decoder.next_event()
+            if isinstance(event, NeedData):
+                if eof:
+                    break
+                chunk = request.stream.read(CHUNK_SIZE)
+                eof = not chunk
+                decoder.receive_data(chunk or None)
+            elif isinstance(event, File):
+                filename = os.path.basename(event.filename or '')
+                dt = parse_many([filename])[0] if event.name == 'files' and filename else None
+                if dt:
+                    # 选择文件夹上传时不同子目录下可能有同名文件，临时文件名加序号区分
+                    filepath = os.path.join(tmpdir, f'{len(saved)}_{filename}')
+                    out = open(filepath, 'wb')
+                    saved.append((filepath, event.filename, dt))
+            elif isinstance(event, Field):
+                out = None
+            elif isinstance(event, Data):
+                if out is not None:
+                    out.write(event.data)
+                    if not event.more_data:
+                        out.close()
+                        out = None
+            elif isinstance(event, Epilogue):
+                break
+    except ValueError:
+        # 请求体不完整或格式错误（例如客户端中途取消上传）
+        abort(400)
+    finally:
+        if out is not None:
+            out.close()
+        METRICS.observe('stage_seconds', time.perf_counter() - start, stage='upload')
+    METRICS.inc('bytes_received_total', request.content_length or 0)
+    return saved
 
 
-@app.route('/')
-def index():
-    return render_template_string(HTML)
+def zip_response(entries, on_close=None) -> Response:
+    response = Response(stream_zip(entries), mimetype='application/zip')
+    response.headers['Content-Disposition'] = 'attachment; filename=photos_fixed.zip'
+    if on_close is not None:
+        response.call_on_close(on_close)
+    return response
 
 
-@app.route('/parse', methods=['POST'])
-def parse():
-    names = request.json.get('names', [])
+def file_response(filepath: str, name: str, on_close=None) -> Response:
+    # 单个文件直接返回、不打包：交给 WSGI 服务器的 file_wrapper（gunicorn 等会用 sendfile），
+    # 数据不经过 Python，适合大视频
+    response = send_file(filepath, as_attachment=True, download_name=name, conditional=False)
+    if on_close is not None:
+        response.call_on_close(on_close)
+    return response
+
+
+def wants_raw() -> bool:
+    return request.args.get('raw') == '1'
+
+
+jobs = JobManager(process_one)
+
+
+@app.route('/patch', methods=['POST'])
+def patch():
+    # 仅元数据模式：客户端上传文件头部片段（JPEG 开头或 moov 原子）及其在文件中的偏移，
+    # 返回等长的日期字段补丁，由浏览器拼回原文件；无法修补的返回 null，客户端改为完整上传
+    names = request.form.getlist('names')
+    offsets = request.form.getlist('offsets')
+    headers = request.files.getlist('headers')
     results = []
-    for name in names:
-        dt = parse_time_from_filename(name)
-        results.append(dt.strftime('%Y-%m-%d %H:%M:%S') if dt else None)
+    for name, offset, header, dt in zip(names, offsets, headers, parse_many(names)):
+        patches = date_patches(header.read(), ZONE.aware(dt), int(offset)) if dt else None
+        if not patches:
+            results.append(None)
+            continue
+        ts = int(ZONE.to_epoch(dt))
+        results.append({
+            'name': output_name(name, dt),
+            'mtime': ts,
+            # 压缩包内的时间按墙钟时间记录，与浏览器所在时区无关
+            'offset': ZONE.utc_offset(ts),
+            'patches': [[pos, base64.b64encode(data).decode('ascii')] for pos, data in patches],
+        })
     return results
 
 
 @app.route('/process', methods=['POST'])
 def process():
-    files = request.files.getlist('files')
+    start = time.perf_counter()
+    tmpdir = tempfile.mkdtemp()
+    try:
+        saved = receive_uploads(tmpdir)
+    except BaseException:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        raise
     
-    with tempfile.TemporaryDirectory() as tmpdir:
-        processed = []
-        
-        for f in files:
-            dt = parse_time_from_filename(f.filename)
-            if not dt:
-                continue
-            
-            filepath = os.path.join(tmpdir, f.filename)
-            f.save(filepath)
-            
-            dt_str = dt.strftime('%Y:%m:%d %H:%M:%S')
-            cmd = [
-                'exiftool', '-overwrite_original',
-                f'-AllDates={dt_str}',
-                f'-FileModifyDate={dt_str}',
-                f'-FileCreateDate={dt_str}',
-            ]
-            
-            # 针对视频文件增加更多时间标签
-            ext = Path(f.filename).suffix.lower()
-            if ext in ['.mp4', '.mov', '.m4v', '.3gp', '.avi', '.mkv', '.wmv']:
-                cmd.extend([
-                    f'-CreateDate={dt_str}',
-                    f'-ModifyDate={dt_str}',
-                    f'-TrackCreateDate={dt_str}',
-                    f'-TrackModifyDate={dt_str}',
-                    f'-MediaCreateDate={dt_str}',
-                    f'-MediaModifyDate={dt_str}',
-                    f'-CreationDate={dt_str}',
-                    f'-DateTimeOriginal={dt_str}',
-                ])
-            cmd.append(filepath)
-            subprocess.run(cmd, capture_output=True)
-            
-            ts = dt.timestamp()
-            os.utime(filepath, (ts, ts))
-            
-            ext = Path(f.filename).suffix
-            new_name = dt.strftime('%Y%m%d') + '_' + str(int(ts)) + ext
-            new_path = os.path.join(tmpdir, new_name)
-            os.rename(filepath, new_path)
-            
-            processed.append((new_path, new_name))
-        
-        zip_buffer = BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-            for fp, name in processed:
-                zf.write(fp, name)
-        
-        zip_buffer.seek(0)
-        return send_file(zip_buffer, mimetype='application/zip', download_name='photos_fixed.zip')
+    def on_close():
+        # 响应体流式输出完毕才算请求结束
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        METRICS.observe('request_seconds', time.perf_counter() - start, route='/process')
+    
+    # ?raw=1 且只有一个文件时直接返回处理后的文件
+    if wants_raw() and len(saved) == 1:
+        try:
+            new_path, new_name = process_one(saved[0])
+        except BaseException:
+            on_close()
+            raise
+        return file_response(new_path, new_name, on_close)
+    return zip_response(unique_names(process_saved(saved)), on_close)
+
+
+@app.route('/metrics')
+def metrics():
+    return Response(METRICS.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    # 保存上传后立即返回任务 ID，文件由后台工作线程处理；
+    # ?open=1 创建上传会话，之后通过 /jobs/<id>/files 追加文件，/jobs/<id>/close 结束
+    tmpdir = tempfile.mkdtemp()
+    try:
+        saved = receive_uploads(tmpdir)
+    except BaseException:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        raise
+    
+    job = jobs.submit(tmpdir, saved, sealed=request.args.get('open') != '1')
+    return job.snapshot(), 202
+
+
+def get_job(job_id: str):
+    if (job := jobs.get(job_id)) is None:
+        abort(404)
+    return job
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    return get_job(job_id).snapshot()
+
+
+@app.route('/jobs/<job_id>/files', methods=['POST'])
+def add_job_files(job_id):
+    # 每个请求写入会话目录下独立的子目录，并发上传的同名文件互不覆盖
+    job = get_job(job_id)
+    tmpdir = tempfile.mkdtemp(dir=job.tmpdir)
+    try:
+        saved = receive_uploads(tmpdir)
+    except BaseException:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        raise
+    
+    if not jobs.add(job, saved):
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        return {'error': '任务已关闭', **job.snapshot()}, 409
+    return job.snapshot(), 202
+
+
+@app.route('/jobs/<job_id>/close', methods=['POST'])
+def close_job(job_id):
+    job = get_job(job_id)
+    jobs.seal(job)
+    return job.snapshot()
+
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    # SSE 推送进度，任务完成后结束
+    job = get_job(job_id)
+    
+    def events():
+        state = None
+        while True:
+            state = job.wait(state, 15)
+            yield f'data: {json.dumps(state)}\n\n'
+            if state['status'] == 'done':
+                return
+    
+    return Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+@app.route('/jobs/<job_id>/download')
+def job_download(job_id):
+    job = get_job(job_id)
+    if job.status != 'done':
+        return {'error': '任务尚未完成', **job.snapshot()}, 409
+    if wants_raw() and len(job.results) == 1:
+        return file_response(*job.results[0])
+    return zip_response(unique_names(list(job.results)))
+
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def delete_job(job_id):
+    get_job(job_id)
+    jobs.remove(job_id)
+    return '', 204
 
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8080)
-
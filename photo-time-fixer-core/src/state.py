@@ -0,0 +1,65 @@
+import os
+import sqlite3
+import time
+from datetime import datetime
+from pathlib import Path
+
+# 增量运行的状态索引：以 (路径, 大小, mtime, inode) 记录每个文件的解析结果和写入状态，
+# 文件未变化且已修正的直接跳过；每处理一批就提交一次，中断后可从断点继续
+
+STATE_FILE_NAME = '.photo-time-fixer.sqlite'
+COMMIT_EVERY = 500
+
+
+class StateIndex:
+    def __init__(self, path: Path, root: Path):
+        self.path = path
+        self.root = root
+        self._db = sqlite3.connect(path)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            ' path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER,'
+            ' parsed TEXT, status TEXT, updated REAL)'
+        )
+        # 一次性读入内存，重复扫描时不再逐个查询数据库
+        self._done = {
+            path: (size, mtime_ns, inode)
+            for path, size, mtime_ns, inode in self._db.execute(
+                "SELECT path, size, mtime_ns, inode FROM files WHERE status IN ('fixed', 'correct')")
+        }
+        self._pending = []
+
+    def _key(self, path: Path) -> str:
+        return path.relative_to(self.root).as_posix()
+
+    def is_done(self, path: Path, st: os.stat_result) -> bool:
+        return self._done.get(self._key(path)) == (st.st_size, st.st_mtime_ns, st.st_ino)
+
+    def record(self, path: Path, status: str, dt: datetime | None):
+        try:
+            st = path.stat()
+        except OSError:
+            return
+        key = self._key(path)
+        self._pending.append((key, st.st_size, st.st_mtime_ns, st.st_ino,
+                              dt.isoformat() if dt else None, status, time.time()))
+        if status in ('fixed', 'correct'):
+            self._done[key] = (st.st_size, st.st_mtime_ns, st.st_ino)
+        if len(self._pending) >= COMMIT_EVERY:
+            self.commit()
+
+    def commit(self):
+        if self._pending:
+            self._db.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)', self._pending)
+            self._pending.clear()
+        self._db.commit()
+
+    def close(self):
+        self.commit()
+        self._db.close()
+
+    def owns(self, path: Path) -> bool:
+        # 状态文件本身（含 -wal/-shm）不参与处理
+        return path.name.startswith(self.path.name)
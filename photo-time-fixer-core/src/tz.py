@@ -0,0 +1,134 @@
+import calendar
+import re
+import time
+from datetime import datetime, timedelta, timezone
+
+# 时间戳与墙钟时间的换算。未指定时区时沿用本机时区（即 datetime.fromtimestamp 的结果）；
+# 指定时区后结果与运行环境无关：UTC 偏移按天缓存，当天没有夏令时切换时只需一次加法，
+# 切换当天才逐个查询 zoneinfo
+
+EPOCH = datetime(1970, 1, 1)
+DAY = 86400
+
+_RE_OFFSET = re.compile(r'(?:UTC|GMT)?([+-])(\d{1,2})(?::?(\d{2}))?', re.IGNORECASE)
+
+
+def parse_offset(spec: str) -> int | None:
+    # '+08:00'、'+0800'、'UTC+8'、'-05:30'、'UTC'、'Z' 等固定偏移，返回秒数；不是固定偏移时返回 None
+    if spec.upper() in ('UTC', 'GMT', 'Z'):
+        return 0
+    m = _RE_OFFSET.fullmatch(spec)
+    if not m:
+        return None
+    hours, minutes = int(m.group(2)), int(m.group(3) or 0)
+    if hours > 14 or minutes >= 60:
+        return None
+    seconds = hours * 3600 + minutes * 60
+    return -seconds if m.group(1) == '-' else seconds
+
+
+def format_offset(seconds: int) -> str:
+    # EXIF OffsetTime 格式：+08:00
+    sign = '-' if seconds < 0 else '+'
+    minutes = abs(seconds) // 60
+    return f'{sign}{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+class Zone:
+    def __init__(self, name: str | None = None):
+        self.configure(name)
+
+    def configure(self, name: str | None):
+        # name 为 None 时使用本机时区；IANA 时区名需要系统时区数据库（Windows 上需安装 tzdata）
+        self.name = name
+        self._fixed = None
+        self._zone = None
+        if name is not None:
+            self._fixed = parse_offset(name)
+            if self._fixed is None:
+                from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+                try:
+                    self._zone = ZoneInfo(name)
+                except (ZoneInfoNotFoundError, ValueError):
+                    raise ValueError(f'未知时区: {name}') from None
+        # UTC 日序号 / 本地日序号 -> 当天的偏移，当天有切换时为 None
+        self._utc_days = {}
+        self._local_days = {}
+        self._zones = {}
+
+    @property
+    def explicit(self) -> bool:
+        return self.name is not None
+
+    def _offset_at(self, ts: int) -> int:
+        # 某一时刻的 UTC 偏移（秒），不经过缓存
+        if self._zone is not None:
+            return int(datetime.fromtimestamp(ts, self._zone).utcoffset().total_seconds())
+        return time.localtime(ts).tm_gmtoff
+
+    def _offset_of(self, dt: datetime) -> int:
+        # 某一墙钟时间的 UTC 偏移；夏令时重叠时取较早的时刻，不存在的时刻按切换前的偏移
+        if self._zone is not None:
+            return int(dt.replace(tzinfo=self._zone).utcoffset().total_seconds())
+        return calendar.timegm(dt.timetuple()) - int(dt.replace(microsecond=0).timestamp())
+
+    def utc_offset(self, ts: float) -> int:
+        if self._fixed is not None:
+            return self._fixed
+        day = int(ts // DAY)
+        try:
+            offset = self._utc_days[day]
+        except KeyError:
+            start = self._offset_at(day * DAY)
+            offset = self._utc_days[day] = start if start == self._offset_at(day * DAY + DAY - 1) else None
+        return offset if offset is not None else self._offset_at(int(ts))
+
+    def local_offset(self, dt: datetime) -> int:
+        if self._fixed is not None:
+            return self._fixed
+        day = dt.toordinal()
+        try:
+            offset = self._local_days[day]
+        except KeyError:
+            midnight = datetime(dt.year, dt.month, dt.day)
+            start = self._offset_of(midnight)
+            end = self._offset_of(midnight + timedelta(seconds=DAY - 1))
+            offset = self._local_days[day] = start if start == end else None
+        return offset if offset is not None else self._offset_of(dt.replace(tzinfo=None))
+
+    def from_epoch(self, ts: float) -> datetime:
+        # 返回不带时区的墙钟时间
+        if self._fixed is not None:
+            return EPOCH + timedelta(0, ts + self._fixed)
+        if self._zone is None:
+            return datetime.fromtimestamp(ts)
+        return EPOCH + timedelta(0, ts + self.utc_offset(ts))
+
+    def to_epoch(self, dt: datetime) -> float:
+        # dt 为该时区的墙钟时间（带时区时按自身偏移）
+        if dt.tzinfo is not None:
+            offset = int(dt.utcoffset().total_seconds())
+        elif self._fixed is None and self._zone is None:
+            return dt.timestamp()
+        else:
+            offset = self.local_offset(dt)
+        return calendar.timegm(dt.timetuple()) - offset + dt.microsecond / 1e6
+
+    def offset_string(self, dt: datetime) -> str:
+        if dt.tzinfo is not None:
+            return format_offset(int(dt.utcoffset().total_seconds()))
+        return format_offset(self.local_offset(dt))
+
+    def aware(self, dt: datetime) -> datetime:
+        # 显式指定时区时附加该时刻的 UTC 偏移（写入 OffsetTime 标签用），否则原样返回
+        if not self.explicit or dt.tzinfo is not None:
+            return dt
+        offset = self.local_offset(dt)
+        if (tz := self._zones.get(offset)) is None:
+            tz = self._zones[offset] = timezone(timedelta(seconds=offset))
+        return dt.replace(tzinfo=tz)
+
+
+# 命令行 --tz 和服务端 PHOTO_TZ 在启动时配置
+ZONE = Zone()
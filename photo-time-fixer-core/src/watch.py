@@ -0,0 +1,190 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+from pathlib import Path
+
+from scan import scan_files
+
+# 监听目录中新到达的文件：Linux 上通过 ctypes 调用 inotify，其他系统或 inotify 不可用时
+# （例如 CIFS 客户端挂载）回退为定时检查目录修改时间；新文件在大小稳定后才交给处理流程
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_ONLYDIR
+EVENT_HEADER = struct.Struct('iIII')
+
+POLL_INTERVAL = 2.0
+
+
+class InotifyWatcher:
+    def __init__(self, root: Path, recursive: bool = False):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), '无法初始化 inotify')
+        self.recursive = recursive
+        self._dirs = {}
+        self._add(root)
+
+    def _add(self, directory: Path):
+        # 递归模式下同时监听所有子目录
+        wd = self._add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f'无法监听目录: {directory}')
+        self._dirs[wd] = directory
+        if self.recursive:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        self._add(Path(entry.path))
+
+    def read(self, timeout: float) -> tuple[list[Path], bool]:
+        # 返回 (有变化的文件, 是否发生队列溢出)；溢出时调用方需要补扫一次目录
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return [], False
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return [], False
+        paths = []
+        overflow = False
+        pos = 0
+        while pos + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, pos)
+            name = os.fsdecode(data[pos + EVENT_HEADER.size:pos + EVENT_HEADER.size + length].rstrip(b'\0'))
+            pos += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+                continue
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            directory = self._dirs.get(wd)
+            if directory is None or not name:
+                continue
+            path = directory / name
+            if mask & IN_ISDIR:
+                if self.recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                    try:
+                        self._add(path)
+                    except OSError:
+                        continue
+                    # 整个目录移入时，其中的文件不会再产生事件
+                    paths.extend(Path(entry.path) for entry in scan_files(path, recursive=True))
+                continue
+            paths.append(path)
+        return paths, overflow
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    # 定时 stat 各目录，只有目录修改时间变化（有文件新建、移入或改名）时才重新列出该目录，
+    # 与上次的文件名集合比较得到新文件；文件内容的后续增长由 Debouncer 跟踪
+    def __init__(self, root: Path, recursive: bool = False, interval: float = POLL_INTERVAL):
+        self.recursive = recursive
+        self.interval = interval
+        self._dirs = {}
+        self._last = time.monotonic()
+        self._list(root)
+
+    def _list(self, directory: Path) -> list[Path]:
+        # 记录目录的修改时间和文件名集合，返回其中的文件；递归模式下同时登记子目录
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError:
+            self._dirs.pop(directory, None)
+            return []
+        names = set()
+        files = []
+        for entry in entries:
+            names.add(entry.name)
+            if entry.is_file():
+                files.append(Path(entry.path))
+            elif self.recursive and entry.is_dir(follow_symlinks=False) and Path(entry.path) not in self._dirs:
+                files += self._list(Path(entry.path))
+        self._dirs[directory] = (mtime_ns, names)
+        return files
+
+    def read(self, timeout: float) -> tuple[list[Path], bool]:
+        wait = self._last + self.interval - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return [], False
+        time.sleep(max(0.0, wait))
+        self._last = time.monotonic()
+        # 文件系统时间精度较粗时，同一时间片内的后续修改不会改变目录时间，刚修改过的目录每次都重新列出
+        recent = time.time_ns() - int(self.interval * 2e9)
+        changed = []
+        for directory, (mtime_ns, names) in list(self._dirs.items()):
+            try:
+                current = os.stat(directory).st_mtime_ns
+            except OSError:
+                del self._dirs[directory]
+                continue
+            if current == mtime_ns and current < recent:
+                continue
+            for f in self._list(directory):
+                if f.parent != directory or f.name not in names:
+                    changed.append(f)
+        return changed, False
+
+    def close(self):
+        pass
+
+
+def open_watcher(root: Path, recursive: bool = False, poll: bool = False):
+    if not poll and hasattr(select, 'select') and os.name == 'posix':
+        try:
+            return InotifyWatcher(root, recursive)
+        except (OSError, AttributeError, TypeError):
+            pass
+    return PollingWatcher(root, recursive)
+
+
+class Debouncer:
+    # 文件大小和修改时间在 settle 秒内保持不变才视为写入完成
+    def __init__(self, settle: float):
+        self.settle = settle
+        self._pending = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def __contains__(self, path: Path) -> bool:
+        return path in self._pending
+
+    def touch(self, path: Path):
+        self._pending[path] = (None, time.monotonic())
+
+    def ready(self) -> list[Path]:
+        now = time.monotonic()
+        done = []
+        for path, (key, since) in list(self._pending.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self._pending[path]
+                continue
+            current = (st.st_size, st.st_mtime_ns)
+            if current != key:
+                self._pending[path] = (current, now)
+            elif now - since >= self.settle:
+                del self._pending[path]
+                done.append(path)
+        return done